@@ -40,7 +40,8 @@ class bdist_rpm(_bdist_rpm):
 libexec_list = [
                 "src/info-dynamic-pbs",
                 "src/lrmsinfo-pbs",
-                "src/vomaxjobs-maui"
+                "src/vomaxjobs-maui",
+                "src/info-collector-pbs"
                ]
 
 setup(
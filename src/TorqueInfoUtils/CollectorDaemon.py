@@ -0,0 +1,357 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import os, os.path
+import time
+import socket
+import array
+import json
+import logging
+from threading import Thread, Lock, Event
+
+from TorqueInfoUtils import CommonUtils
+from TorqueInfoUtils import QStatHandler
+from TorqueInfoUtils import PBSNodesHandler
+from TorqueInfoUtils import MAUIHandler
+
+logger = logging.getLogger("CollectorDaemon")
+
+DEFAULT_SOCKET = CommonUtils.DEFAULT_COLLECTOR_SOCKET
+DEFAULT_INTERVAL = 60
+CLIENT_TIMEOUT = 5
+
+#
+# Wire protocol: the client sends a JSON request with the name of a
+# source and the server it refers to, terminated by a newline; the
+# daemon answers with a JSON object (timestamp, data, error message,
+# polling interval) and closes the connection.
+# Data are plain JSON, the parsed objects are rebuilt by the client.
+# The socket and its directory must belong to the daemon owner, the
+# client refuses the others.
+#
+
+def _jsonDefault(obj):
+    if isinstance(obj, array.array):
+        return obj.tolist()
+    raise TypeError("%s is not JSON serializable" % repr(obj))
+
+def _plain(value):
+    #
+    # JSON strings are unicode, the parsers produce str
+    #
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [ _plain(item) for item in value ]
+    if isinstance(value, dict):
+        return dict([ (_plain(key), _plain(item)) for key, item in value.items() ])
+    return value
+
+def _handlerData(handler):
+    result = dict()
+    for key, value in CommonUtils.handlerState(handler).items():
+        if not key.endswith('Regex'):
+            result[key] = value
+    return result
+
+#
+# encodeData returns the JSON text of the data of a source, computed
+# once per collection; decodeData rebuilds the parser objects
+#
+def encodeData(source, data):
+    if source == 'pbsnodes':
+        nodes = list()
+        for record in data.nodes.itervalues():
+            nodes.append(dict([ (key, getattr(record, key)) for key in PBSNodesHandler.NodeRecord.__slots__ ]))
+        data = { 'totalCPU' : data.totalCPU, 'freeCPU' : data.freeCPU,
+                 'gpuTable' : data.gpuTable, 'nodes' : nodes }
+    elif source == 'queues':
+        data = dict([ (queue, _handlerData(handler)) for queue, handler in data.items() ])
+    elif source == 'qstat':
+        data = [ dict(job.items()) for job in data ]
+    elif source == 'diagnose':
+        data = { 'limitTable' : data.limitTable }
+    return json.dumps(data, default=_jsonDefault)
+
+def decodeData(source, data):
+    data = _plain(data)
+    
+    if source == 'pbsnodes':
+        container = PBSNodesHandler.CPUInfoHandler()
+        container.totalCPU = data['totalCPU']
+        container.freeCPU = data['freeCPU']
+        container.gpuTable = data['gpuTable']
+        for nodeData in data['nodes']:
+            record = PBSNodesHandler.NodeRecord(nodeData['name'])
+            record.state = nodeData['state']
+            record.np = nodeData['np']
+            record.properties = tuple(nodeData['properties'])
+            record.jobSlots = array.array('H', nodeData['jobSlots'])
+            record.jobIds = tuple(nodeData['jobIds'])
+            record.totalGPUs = nodeData['totalGPUs']
+            record.freeGPUs = nodeData['freeGPUs']
+            container.nodes[record.name] = record
+            for prop in record.properties:
+                container.propertyIndex.setdefault(prop, list()).append(record)
+        return container
+    
+    if source == 'queues':
+        handlers = dict()
+        for queue, qData in data.items():
+            handlers[queue] = QStatHandler.QueueInfoHandler()
+            for key, value in qData.items():
+                setattr(handlers[queue], key, value)
+        return handlers
+    
+    if source == 'qstat':
+        jobList = list()
+        for jData in data:
+            job = QStatHandler.JobRecord()
+            for key, value in jData.items():
+                job[key] = value
+            jobList.append(job)
+        return jobList
+    
+    if source == 'diagnose':
+        container = MAUIHandler.DiagnoseHandler()
+        container.limitTable = data['limitTable']
+        return container
+    
+    return data
+
+
+def _collectJobs(pbsHost):
+    jobList = list()
+    QStatHandler.parse(jobList, pbsHost)
+    return jobList
+
+
+class SourcePoller(Thread):
+
+    def __init__(self, daemon, source, collector, args):
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.owner = daemon
+        self.source = source
+        self.collector = collector
+        self.args = args
+
+    def run(self):
+        while not self.owner.stopEvent.isSet():
+            try:
+                startTime = time.time()
+                data = self.collector(*self.args)
+                self.owner.update(self.source, data)
+                logger.debug("Collected %s in %.2fs" % (self.source, time.time() - startTime))
+            except:
+                errMsg = CommonUtils.errorMsgFromTrace()
+                logger.error("Cannot collect %s: %s" % (self.source, errMsg))
+                self.owner.updateError(self.source, errMsg)
+            self.owner.stopEvent.wait(self.owner.interval)
+
+
+class RequestHandler(Thread):
+
+    def __init__(self, daemon, conn):
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.owner = daemon
+        self.conn = conn
+
+    def run(self):
+        try:
+            try:
+                self.conn.settimeout(CLIENT_TIMEOUT)
+                request = ''
+                while not request.endswith('\n') and len(request) < 256:
+                    chunk = self.conn.recv(256)
+                    if not chunk:
+                        break
+                    request += chunk
+                
+                request = json.loads(request)
+                timestamp, data, errMsg = self.owner.lookup(request['source'], request['server'])
+                reply = '{"timestamp": %s, "data": %s, "error": %s, "interval": %s}' % (
+                        json.dumps(timestamp), data or 'null', json.dumps(errMsg), json.dumps(self.owner.interval))
+                self.conn.sendall(reply)
+            except:
+                logger.debug("Error serving request", exc_info=True)
+        finally:
+            self.conn.close()
+
+
+class CollectorDaemon:
+
+    def __init__(self, config):
+        self.pbsHost = config['pbs-host']
+        self.socketPath = config['collector-socket']
+        self.interval = config['collector-interval']
+        self.stopEvent = Event()
+        self.lock = Lock()
+        self.state = dict()
+        
+        #
+        # the server of each source, requests for other servers are refused
+        #
+        self.servers = { 'lrmsver' : self.pbsHost, 'pbsnodes' : self.pbsHost,
+                         'queues' : self.pbsHost, 'qstat' : self.pbsHost,
+                         'diagnose' : [ config['maui-host'], config['maui-keyfile'] ] }
+        
+        self.pollers = [
+            SourcePoller(self, 'pbsnodes', PBSNodesHandler.parseCPUInfo, (self.pbsHost,)),
+            SourcePoller(self, 'queues', self._collectQueues, ()),
+            SourcePoller(self, 'qstat', _collectJobs, (self.pbsHost,))
+        ]
+        if MAUIHandler.available():
+            self.pollers.append(SourcePoller(self, 'diagnose', MAUIHandler.parseJobLimit,
+                                             (config['maui-host'], config['maui-keyfile'])))
+
+    def _collectQueues(self):
+        #
+        # the LRMS version comes from the same qstat -B call
+        #
+        serverInfo = QStatHandler.parseServerInfo(self.pbsHost)
+        self.update('lrmsver', serverInfo.version)
+        return QStatHandler.parseAllQueuesInfo(None, self.pbsHost, serverInfo=serverInfo)
+
+    def update(self, source, data):
+        self.lock.acquire()
+        try:
+            self.state[source] = (time.time(), encodeData(source, data), None)
+        finally:
+            self.lock.release()
+
+    def updateError(self, source, errMsg):
+        #
+        # the last good data are kept, with their own timestamp
+        #
+        self.lock.acquire()
+        try:
+            if source in self.state:
+                timestamp, data, oldErr = self.state[source]
+                self.state[source] = (timestamp, data, errMsg)
+            else:
+                self.state[source] = (None, None, errMsg)
+        finally:
+            self.lock.release()
+
+    def lookup(self, source, server=None):
+        if self.servers.get(source) <> server:
+            return (None, None, "The collector does not query %s for %s" % (server, source))
+        
+        self.lock.acquire()
+        try:
+            if source in self.state:
+                return self.state[source]
+            return (None, None, "No data for %s" % source)
+        finally:
+            self.lock.release()
+
+    def _bind(self):
+        #
+        # only the daemon owner can reach the socket
+        #
+        sockDir = os.path.dirname(self.socketPath)
+        if not os.path.isdir(sockDir):
+            os.makedirs(sockDir, 0700)
+        if os.stat(sockDir).st_uid <> os.getuid():
+            raise Exception("Insecure collector directory " + sockDir)
+        os.chmod(sockDir, 0700)
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+        
+        srvSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        srvSocket.bind(self.socketPath)
+        os.chmod(self.socketPath, 0600)
+        srvSocket.listen(16)
+        srvSocket.settimeout(1)
+        return srvSocket
+
+    def serve(self):
+        for poller in self.pollers:
+            poller.start()
+        
+        srvSocket = self._bind()
+        logger.info("Collector listening on %s" % self.socketPath)
+        
+        try:
+            while not self.stopEvent.isSet():
+                try:
+                    conn, addr = srvSocket.accept()
+                except socket.timeout:
+                    continue
+                RequestHandler(self, conn).start()
+        finally:
+            srvSocket.close()
+            if os.path.exists(self.socketPath):
+                os.remove(self.socketPath)
+
+    def stop(self):
+        self.stopEvent.set()
+
+
+def query(source, server, socketPath=DEFAULT_SOCKET, maxAge=None):
+
+    #
+    # Returns the data collected by the daemon for source on server, or
+    # None if the daemon is not running, collects for another server, has
+    # no data or data are too old; by default data older than three
+    # polling intervals of the daemon are too old
+    #
+    if not socketPath or not os.path.exists(socketPath):
+        return None
+    
+    if not (CommonUtils.isPrivatePath(os.path.dirname(os.path.abspath(socketPath)))
+            and CommonUtils.isPrivatePath(socketPath)):
+        logger.error("Insecure collector socket %s, ignored" % socketPath)
+        return None
+    
+    cliSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            cliSocket.settimeout(CLIENT_TIMEOUT)
+            cliSocket.connect(socketPath)
+            cliSocket.sendall(json.dumps({ 'source' : source, 'server' : server }) + '\n')
+            
+            chunks = list()
+            chunk = cliSocket.recv(65536)
+            while chunk:
+                chunks.append(chunk)
+                chunk = cliSocket.recv(65536)
+            
+            reply = json.loads(''.join(chunks))
+            timestamp = reply['timestamp']
+            errMsg = reply['error']
+            if maxAge == None:
+                maxAge = 3 * reply['interval']
+        except:
+            logger.debug("Cannot query the collector for %s" % source, exc_info=True)
+            return None
+    finally:
+        cliSocket.close()
+    
+    if errMsg:
+        logger.debug("Collector error for %s: %s" % (source, errMsg))
+    if timestamp == None or not 0 <= time.time() - timestamp <= maxAge:
+        return None
+    
+    try:
+        return decodeData(source, reply['data'])
+    except:
+        logger.debug("Cannot decode the collector data for %s" % source, exc_info=True)
+        return None
+
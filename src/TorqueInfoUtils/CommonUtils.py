@@ -15,14 +15,21 @@
 # limitations under the License.
 
 import sys
+import os
 import re
+import time
+import signal
+import stat
+import mmap
+import tempfile
+import cPickle
 import shlex
 import subprocess
 import traceback
 import glob
 import ConfigParser
 import logging
-from threading import Thread
+from threading import Thread, Semaphore
 
 logger = logging.getLogger("CommonUtils")
 
@@ -40,23 +47,93 @@ class ErrorHandler(Thread):
             line = self.stream.readline()
 
 
-def parseStream(cmd, container):
+class CommandTimeout(Exception):
+
+    #
+    # The command was killed after timeout seconds; container holds
+    # what was parsed before, for the callers that accept partial data
+    #
+    def __init__(self, message, container=None):
+        Exception.__init__(self, message)
+        self.container = container
+
+
+#
+# Default timeouts in seconds, by executable name
+#
+COMMAND_TIMEOUTS = dict()
+
+def setCommandTimeouts(timeouts):
+    COMMAND_TIMEOUTS.clear()
+    for cmdName, timeout in timeouts.items():
+        if timeout:
+            COMMAND_TIMEOUTS[cmdName] = timeout
+
+
+#
+# Seconds to wait for the readers after a kill: a child that left the
+# process group (an ssh master) may keep the pipes open
+#
+KILL_JOIN_TIMEOUT = 2
+
+def parseStream(cmd, container, timeout=None):
 
     processErr = None
+    timedOut = False
+    
+    if timeout == None:
+        timeout = COMMAND_TIMEOUTS.get(os.path.basename(cmd[0]))
     
     try:
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if timeout:
+            #
+            # the command and its children get their own process group
+            #
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       preexec_fn=os.setsid)
+        else:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     
         container.setStream(process.stdout)
         stderr_thread = ErrorHandler(process.stderr)
+        if timeout:
+            container.setDaemon(True)
+            stderr_thread.setDaemon(True)
     
         container.start()
         stderr_thread.start()
     
-        ret_code = process.wait()
-    
-        container.join()
-        stderr_thread.join()
+        if timeout:
+            deadline = time.time() + timeout
+            container.join(timeout)
+            ret_code = process.poll()
+            while ret_code == None and time.time() < deadline:
+                time.sleep(0.05)
+                ret_code = process.poll()
+            
+            if ret_code == None or container.isAlive():
+                timedOut = True
+                logger.debug("Killing %s after %ds", repr(cmd), timeout)
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                ret_code = process.wait()
+            
+            graceEnd = time.time() + KILL_JOIN_TIMEOUT
+            container.join(KILL_JOIN_TIMEOUT)
+            stderr_thread.join(max(graceEnd - time.time(), 0))
+            if timedOut:
+                for stream in (process.stdout, process.stderr):
+                    try:
+                        stream.close()
+                    except IOError:
+                        # still read by an abandoned thread
+                        pass
+        else:
+            ret_code = process.wait()
+            container.join()
+            stderr_thread.join()
         
         if ret_code <> 0:
             processErr = stderr_thread.message
@@ -68,10 +145,239 @@ def parseStream(cmd, container):
         logger.debug("Error running %s", repr(cmd), exc_info=True)
         raise Exception(errorMsgFromTrace())
 
+    if timedOut:
+        raise CommandTimeout("Timeout running %s (%ds)" % (os.path.basename(cmd[0]), timeout), container)
+
+    if processErr:
+        raise Exception(processErr)
+
+
+FILE_BUFSIZE = 1048576
+MMAP_THRESHOLD = 67108864
+
+def parseFile(filename, container, useMmap=None):
+
+    #
+    # Feeds the container straight from the file, in the calling thread;
+    # errors are reported as in parseStream
+    #
+    inFile = None
+    mFile = None
+    
+    try:
+        inFile = open(filename, 'rb', FILE_BUFSIZE)
+        
+        if useMmap == None:
+            useMmap = os.fstat(inFile.fileno()).st_size >= MMAP_THRESHOLD
+        if useMmap and os.fstat(inFile.fileno()).st_size > 0:
+            mFile = mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ)
+            container.setStream(mFile)
+        else:
+            container.setStream(inFile)
+        
+        container.run()
+    
+    except:
+        logger.debug("Error reading %s", filename, exc_info=True)
+        raise Exception(errorMsgFromTrace())
+    
+    finally:
+        if mFile:
+            mFile.close()
+        if inFile:
+            inFile.close()
+
+    if len(container.errList) > 0:
+        raise Exception(container.errList[0])
+
+
+
+class CollectionTask(Thread):
+
+    def __init__(self, semaphore, function, args):
+        Thread.__init__(self)
+        self.semaphore = semaphore
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+
+    def run(self):
+        self.semaphore.acquire()
+        try:
+            try:
+                self.result = self.function(*self.args)
+            except Exception, ex:
+                logger.debug("Error running collection task", exc_info=True)
+                self.error = ex
+        finally:
+            self.semaphore.release()
+
+
+class CollectionScheduler:
+
+    #
+    # Runs independent collection functions concurrently, at most
+    # maxConcurrent at a time; errors are raised by result(),
+    # for the source they belong to
+    #
+    def __init__(self, maxConcurrent=3):
+        self.semaphore = Semaphore(max(1, maxConcurrent))
+        self.tasks = dict()
+        self.order = list()
+
+    def add(self, name, function, *args):
+        self.tasks[name] = CollectionTask(self.semaphore, function, args)
+        self.order.append(name)
+
+    def start(self):
+        for name in self.order:
+            self.tasks[name].start()
+
+    def result(self, name, timeout=None):
+        task = self.tasks[name]
+        task.join(timeout)
+        if task.isAlive():
+            raise CommandTimeout("Timeout collecting %s" % name)
+        if task.error:
+            raise task.error
+        return task.result
+
+    def run(self):
+        self.start()
+        for name in self.order:
+            self.tasks[name].join()
+
+
+class TimeBudget:
+
+    #
+    # Time left to the whole run; without a budget there is no deadline
+    #
+    def __init__(self, seconds=None, startTime=None):
+        if startTime == None:
+            startTime = time.time()
+        if seconds:
+            self.deadline = startTime + seconds
+        else:
+            self.deadline = None
+
+    def remaining(self):
+        if self.deadline == None:
+            return None
+        return max(self.deadline - time.time(), 0)
+
+    def expired(self):
+        return self.deadline <> None and time.time() >= self.deadline
+
+    def bound(self, timeouts):
+        #
+        # no command can outlast the budget
+        #
+        if self.deadline == None:
+            return timeouts
+        result = dict()
+        budget = int(self.remaining()) + 1
+        for cmdName, timeout in timeouts.items():
+            if timeout:
+                result[cmdName] = min(timeout, budget)
+            else:
+                result[cmdName] = budget
+        return result
+
+
+def handlerState(handler):
+
+    #
+    # Parsed data of a handler, without the thread and stream objects;
+    # used by the handlers as __getstate__ to make the results picklable
+    #
+    result = dict()
+    for key, value in handler.__dict__.items():
+        if key.startswith('_') or key in ('stream', 'container'):
+            continue
+        result[key] = value
+    return result
+
+
+def iterStream(cmd, handler):
+
+    #
+    # Generator version of parseStream: the handler must provide
+    # records(), a generator run in the caller's thread.
+    # If the consumer stops early the process is killed.
+    #
+    processErr = None
+    process = None
+    stderr_thread = None
+    completed = False
+    
+    try:
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+            handler.setStream(process.stdout)
+            stderr_thread = ErrorHandler(process.stderr)
+            stderr_thread.start()
+        
+            for item in handler.records():
+                yield item
+            completed = True
+        
+        except GeneratorExit:
+            raise
+        except:
+            logger.debug("Error running %s", repr(cmd), exc_info=True)
+            raise Exception(errorMsgFromTrace())
+    
+    finally:
+        if process:
+            if not completed and process.poll() == None:
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+            process.stdout.close()
+            ret_code = process.wait()
+            if stderr_thread:
+                stderr_thread.join()
+            if completed and ret_code <> 0:
+                processErr = stderr_thread.message
+
+    if len(handler.errList) > 0:
+        processErr = handler.errList[0]
+
     if processErr:
         raise Exception(processErr)
 
 
+def iterFile(filename, handler):
+
+    #
+    # Generator version of parseFile
+    #
+    inFile = None
+    
+    try:
+        try:
+            inFile = open(filename, 'rb', FILE_BUFSIZE)
+            handler.setStream(inFile)
+            for item in handler.records():
+                yield item
+        except GeneratorExit:
+            raise
+        except:
+            logger.debug("Error reading %s", filename, exc_info=True)
+            raise Exception(errorMsgFromTrace())
+    
+    finally:
+        if inFile:
+            inFile.close()
+
+    if len(handler.errList) > 0:
+        raise Exception(handler.errList[0])
+
+
 
 bdiiCfgRegex = re.compile('^\s*BDII_([^=\s]+)\s*=(.+)$')
 
@@ -104,8 +410,100 @@ glue2ShareRegex = re.compile("GLUE2ComputingShareMappingQueue\s*:\s*(.+)")
 managerRegex = re.compile("dn:\s*GLUE2ManagerId\s*=\s*.+")
 manAttrRegex = re.compile("GLUE2ManagerID\s*:\s*(.+)")
 
-def parseLdif(bdiiConffile, glueType):
+def _isPrivate(fStat):
+    return fStat.st_uid == os.getuid() and not stat.S_IMODE(fStat.st_mode) & 022
 
+def isPrivatePath(path):
+    try:
+        return _isPrivate(os.stat(path))
+    except OSError:
+        return False
+
+def openPrivateFile(filename):
+    #
+    # Files loaded with cPickle can run code: they are opened only if
+    # both the file and its directory belong to the current user and
+    # are not writable by group or others
+    #
+    dirname = os.path.dirname(os.path.abspath(filename))
+    if not isPrivatePath(dirname):
+        raise Exception("Insecure directory %s" % dirname)
+    
+    pFile = open(filename, 'rb')
+    if not _isPrivate(os.fstat(pFile.fileno())):
+        pFile.close()
+        raise Exception("Insecure file %s" % filename)
+    return pFile
+
+def writeAtomically(filename, writeData, prefix='', mode=None):
+    #
+    # writeData fills a temporary file in the same directory, renamed
+    # over filename once complete: readers never see a partial file and
+    # the temporary file is removed on any error
+    #
+    tmpfd, tmpname = tempfile.mkstemp('.tmp', prefix, os.path.dirname(filename) or '.')
+    try:
+        try:
+            tmpFile = os.fdopen(tmpfd, 'wb')
+        except:
+            os.close(tmpfd)
+            raise
+        try:
+            writeData(tmpFile)
+        finally:
+            tmpFile.close()
+        if mode <> None:
+            os.chmod(tmpname, mode)
+        os.rename(tmpname, filename)
+    except:
+        try:
+            os.remove(tmpname)
+        except OSError:
+            pass
+        raise
+
+def _ldifKey(filenames):
+    key = list()
+    for filename in filenames:
+        try:
+            fStat = os.stat(filename)
+            key.append((filename, fStat.st_mtime, fStat.st_size))
+        except OSError:
+            key.append((filename, None, None))
+    return key
+
+def _readLdifCache(cacheFile, key):
+    cFile = None
+    try:
+        try:
+            cFile = openPrivateFile(cacheFile)
+            cachedKey, maps = cPickle.load(cFile)
+            if cachedKey == key:
+                logger.debug("Using cached LDIF maps from %s" % cacheFile)
+                return maps
+        except IOError:
+            pass
+        except:
+            logger.debug("Cannot read %s" % cacheFile, exc_info=True)
+    finally:
+        if cFile:
+            cFile.close()
+    return None
+
+def _writeLdifCache(cacheFile, key, maps):
+    try:
+        writeAtomically(cacheFile, lambda cFile: cPickle.dump((key, maps), cFile,
+                        cPickle.HIGHEST_PROTOCOL), '.ldifmaps')
+    except:
+        logger.debug("Cannot write %s" % cacheFile, exc_info=True)
+
+def parseLdifMaps(bdiiConffile, cacheFile=None):
+
+    #
+    # Builds the GLUE1 DN-queue, GLUE2 share-queue and manager tables
+    # reading each static ldif file once; with a cache file the tables
+    # are reused until a file is changed, added or removed
+    #
     bdiiConfig = getBDIIConfig(bdiiConffile)
 
     if 'ldif_dir' in bdiiConfig:
@@ -115,92 +513,97 @@ def parseLdif(bdiiConffile, glueType):
     
     ldifList = glob.glob(ldifDir + '/*.ldif')
     
-    if glueType =='GLUE1':
+    if cacheFile:
+        key = _ldifKey([bdiiConffile] + sorted(ldifList))
+        maps = _readLdifCache(cacheFile, key)
+        if maps:
+            return maps
     
-        result = dict()
-        
-        #
-        # Shortcut for old installations
-        #
-        scFilename = ldifDir + '/static-file-CE.ldif'
-        if scFilename in ldifList:
-            ldifList = [scFilename]
+    #
+    # Shortcut for old installations
+    #
+    glue1Files = set(ldifList)
+    scFilename = ldifDir + '/static-file-CE.ldif'
+    if scFilename in glue1Files:
+        glue1Files = set([scFilename])
+
+    glue2Files = set(ldifList)
+    scFilename1 = ldifDir + '/ComputingManager.ldif'
+    scFilename2 = ldifDir + '/ComputingShare.ldif'
+    if scFilename1 in glue2Files and scFilename2 in glue2Files:
+        glue2Files = set([scFilename1, scFilename2])
+
+    glue1Table = dict()
+    glue2Table = dict()
+    managerTable = dict()
+    
+    for ldifFilename in ldifList:
+    
+        useGlue1 = ldifFilename in glue1Files
+        useGlue2 = ldifFilename in glue2Files
+        if not useGlue1 and not useGlue2:
+            continue
         
-        for ldifFilename in ldifList:
+        ldifFile = None
+        currDN = None
+        currDN1 = None
+        currDN2 = None
+        try:
         
-            ldifFile = None
-            currDN = None
-            try:
-            
-                ldifFile = open(ldifFilename)
-                for line in ldifFile:
-                    parsed = glue1DNRegex.match(line)
-                    if parsed:
+            ldifFile = open(ldifFilename)
+            for line in ldifFile:
+                #
+                # the prefix selects the only regex that can match
+                #
+                if line.startswith('dn:'):
+                    if useGlue1 and glue1DNRegex.match(line):
                         currDN = line.strip()
-                        continue
-                    
-                    parsed = glue1QueueRegex.match(line)
-                    if parsed and currDN:
-                        result[currDN] = parsed.group(1).strip()
-                        continue
-                    
-                    if len(line.strip()) == 0:
-                        currDN = None
-
-            finally:
-                if ldifFile:
-                    ldifFile.close()
-
-    else:
-    
-        result = (dict(), dict())
-
-        #
-        # Shortcut for old installations
-        #
-        scFilename1 = ldifDir + '/ComputingManager.ldif'
-        scFilename2 = ldifDir + '/ComputingShare.ldif'
-        if scFilename1 in ldifList and scFilename2 in ldifList:
-            ldifList = [scFilename1, scFilename2]
-
-        for ldifFilename in ldifList:
-        
-            ldifFile = None
-            currDN1 = None
-            currDN2 = None
-            try:
-            
-                ldifFile = open(ldifFilename)
-                for line in ldifFile:
-                    parsed = glue2DNRegex.match(line)
-                    if parsed:
+                    elif useGlue2 and glue2DNRegex.match(line):
                         currDN1 = line.strip()
-                        continue
-                    
+                    elif useGlue2 and managerRegex.match(line):
+                        currDN2 = line.strip()
+                    continue
+                
+                if line.startswith('GlueCEName'):
+                    parsed = glue1QueueRegex.match(line)
+                    if parsed and currDN and useGlue1:
+                        glue1Table[currDN] = parsed.group(1).strip()
+                    continue
+                
+                if line.startswith('GLUE2ComputingShareMappingQueue'):
                     parsed = glue2ShareRegex.match(line)
                     if parsed and currDN1:
-                        result[0][currDN1] = parsed.group(1).strip()
-                        continue
-                    
-                    parsed = managerRegex.match(line)
-                    if parsed:
-                        currDN2 = line.strip()
-                        continue
-                    
+                        glue2Table[currDN1] = parsed.group(1).strip()
+                    continue
+                
+                if line.startswith('GLUE2ManagerID'):
                     parsed = manAttrRegex.match(line)
                     if parsed and currDN2:
-                        result[1][currDN2] = parsed.group(1).strip()
-                        continue
-                    
-                    if len(line.strip()) == 0:
-                        currDN1 = None
-                        currDN2 = None
+                        managerTable[currDN2] = parsed.group(1).strip()
+                    continue
+                
+                if len(line.strip()) == 0:
+                    currDN = None
+                    currDN1 = None
+                    currDN2 = None
 
-            finally:
-                if ldifFile:
-                    ldifFile.close()
+        finally:
+            if ldifFile:
+                ldifFile.close()
 
-    return result
+    maps = (glue1Table, glue2Table, managerTable)
+    if cacheFile:
+        _writeLdifCache(cacheFile, key, maps)
+    return maps
+
+def parseLdif(bdiiConffile, glueType):
+
+    glue1Table, glue2Table, managerTable = parseLdifMaps(bdiiConffile)
+    if glueType =='GLUE1':
+        return glue1Table
+    return (glue2Table, managerTable)
+
+DEFAULT_COLLECTOR_SOCKET = '/var/run/info-dynamic-pbs/collector.sock'
 
 def readConfigFile(configFile):
 
@@ -239,20 +642,144 @@ def readConfigFile(configFile):
         else:
             config['enable_glue_2_1'] = False
 
+        if tmpConf.has_option('Main','ldif-cache'):
+            config['ldif-cache'] = tmpConf.get('Main', 'ldif-cache')
+        else:
+            config['ldif-cache'] = None
+
+        if tmpConf.has_option('Main','time-budget'):
+            config['time-budget'] = int(tmpConf.get('Main', 'time-budget'))
+        else:
+            config['time-budget'] = None
+
+        if tmpConf.has_option('Main','gpu_max_probes'):
+            config['gpu_max_probes'] = int(tmpConf.get('Main', 'gpu_max_probes'))
+        else:
+            config['gpu_max_probes'] = 16
+
+        if tmpConf.has_option('Main','gpu_ssh_multiplex'):
+            tmps = tmpConf.get('Main', 'gpu_ssh_multiplex').lower()
+            config['gpu_ssh_multiplex'] = (tmps == 'true')
+        else:
+            config['gpu_ssh_multiplex'] = True
+
+        if tmpConf.has_option('Main','gpu_ssh_control_dir'):
+            config['gpu_ssh_control_dir'] = tmpConf.get('Main', 'gpu_ssh_control_dir')
+        else:
+            config['gpu_ssh_control_dir'] = None
+
+        if tmpConf.has_option('Main','gpu_ssh_persist'):
+            config['gpu_ssh_persist'] = int(tmpConf.get('Main', 'gpu_ssh_persist'))
+        else:
+            config['gpu_ssh_persist'] = 600
+
+        if tmpConf.has_option('Main','gpu_cache_file'):
+            config['gpu_cache_file'] = tmpConf.get('Main', 'gpu_cache_file')
+        else:
+            config['gpu_cache_file'] = None
+
+        if tmpConf.has_option('Main','gpu_cache_max_age'):
+            config['gpu_cache_max_age'] = int(tmpConf.get('Main', 'gpu_cache_max_age'))
+        else:
+            config['gpu_cache_max_age'] = 600
+
+        if tmpConf.has_option('Main','gpu_breaker_file'):
+            config['gpu_breaker_file'] = tmpConf.get('Main', 'gpu_breaker_file')
+        else:
+            config['gpu_breaker_file'] = None
+
+        if tmpConf.has_option('Main','gpu_breaker_delay'):
+            config['gpu_breaker_delay'] = int(tmpConf.get('Main', 'gpu_breaker_delay'))
+        else:
+            config['gpu_breaker_delay'] = 60
+
+        if tmpConf.has_option('Main','gpu_breaker_max_delay'):
+            config['gpu_breaker_max_delay'] = int(tmpConf.get('Main', 'gpu_breaker_max_delay'))
+        else:
+            config['gpu_breaker_max_delay'] = 3600
+
+        if tmpConf.has_option('Main','gpu_ssh_timeout'):
+            config['gpu_ssh_timeout'] = int(tmpConf.get('Main', 'gpu_ssh_timeout'))
+        else:
+            config['gpu_ssh_timeout'] = None
+
         if tmpConf.has_option('LRMS','pbs-host'):
             config['pbs-host'] = tmpConf.get('LRMS', 'pbs-host')
         else:
             config["pbs-host"] = None
     
+        if tmpConf.has_option('LRMS','snapshot-dir'):
+            config['snapshot-dir'] = tmpConf.get('LRMS', 'snapshot-dir')
+        else:
+            config['snapshot-dir'] = None
+    
+        if tmpConf.has_option('LRMS','snapshot-ttl'):
+            config['snapshot-ttl'] = int(tmpConf.get('LRMS', 'snapshot-ttl'))
+        else:
+            config['snapshot-ttl'] = 120
+    
+        if tmpConf.has_option('LRMS','max-staleness'):
+            config['max-staleness'] = int(tmpConf.get('LRMS', 'max-staleness'))
+        else:
+            config['max-staleness'] = 0
+    
+        for cmdName in [ 'qstat', 'pbsnodes', 'diagnose' ]:
+            if tmpConf.has_option('LRMS', cmdName + '-timeout'):
+                config[cmdName + '-timeout'] = int(tmpConf.get('LRMS', cmdName + '-timeout'))
+            else:
+                config[cmdName + '-timeout'] = None
+    
+        if tmpConf.has_option('LRMS','max-concurrent-queries'):
+            config['max-concurrent-queries'] = int(tmpConf.get('LRMS', 'max-concurrent-queries'))
+        else:
+            config['max-concurrent-queries'] = 3
+    
+        if tmpConf.has_option('LRMS','collector-socket'):
+            config['collector-socket'] = tmpConf.get('LRMS', 'collector-socket')
+        else:
+            config['collector-socket'] = DEFAULT_COLLECTOR_SOCKET
+    
+        if tmpConf.has_option('LRMS','collector-interval'):
+            config['collector-interval'] = int(tmpConf.get('LRMS', 'collector-interval'))
+        else:
+            config['collector-interval'] = 60
+    
+        if tmpConf.has_option('LRMS','maui-host'):
+            config['maui-host'] = tmpConf.get('LRMS', 'maui-host')
+        else:
+            config['maui-host'] = None
+    
+        if tmpConf.has_option('LRMS','maui-keyfile'):
+            config['maui-keyfile'] = tmpConf.get('LRMS', 'maui-keyfile')
+        else:
+            config['maui-keyfile'] = None
+    
         if tmpConf.has_option('WSInterface','status-probe'):
             config['status-probe'] = tmpConf.get('WSInterface', 'status-probe').strip('"\'')
     
+        if tmpConf.has_option('WSInterface','status-probe-timeout'):
+            config['status-probe-timeout'] = int(tmpConf.get('WSInterface', 'status-probe-timeout'))
+        else:
+            config['status-probe-timeout'] = DEFAULT_PROBE_TIMEOUT
+    
+        if tmpConf.has_option('WSInterface','status-probe-ttl'):
+            config['status-probe-ttl'] = int(tmpConf.get('WSInterface', 'status-probe-ttl'))
+        else:
+            config['status-probe-ttl'] = 0
+    
     finally:
         if conffile:
             conffile.close()
 
     config['vomap'] = vomap
     
+    config['command-timeouts'] = {
+        'qstat' : config['qstat-timeout'],
+        'pbsnodes' : config['pbsnodes-timeout'],
+        'diagnose' : config['diagnose-timeout'],
+        'ssh' : config['gpu_ssh_timeout']
+    }
+    
     if config["outputformat"] not in ["glue1", "glue2", "both"]:
         raise Exception("FATAL: Unknown output format specified in config file:%s" % config["outputformat"])
 
@@ -273,11 +800,35 @@ def errorMsgFromTrace():
     return result
 
 
+DEFAULT_PROBE_TIMEOUT = 10
+
 def interfaceIsOff(config):
     try:
     
         if 'status-probe' in config:
-            retcode = subprocess.call(shlex.split(config['status-probe']))
+            #
+            # the probe and its children get their own process group
+            #
+            process = subprocess.Popen(shlex.split(config['status-probe']), preexec_fn=os.setsid)
+            
+            #
+            # a probe that does not answer in time cannot switch the interface off
+            #
+            deadline = time.time() + config.get('status-probe-timeout', DEFAULT_PROBE_TIMEOUT)
+            retcode = process.poll()
+            while retcode == None and time.time() < deadline:
+                time.sleep(0.05)
+                retcode = process.poll()
+            
+            if retcode == None:
+                logger.error("Timeout running %s", config['status-probe'])
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                process.wait()
+                return False
+            
             return retcode == 1 or retcode == 2
         
     except:
@@ -0,0 +1,193 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import logging
+
+from TorqueInfoUtils.QStatHandler import RES_UNDEF
+
+logger = logging.getLogger("GlueRenderer")
+
+MAX_INT32 = 2**31-1
+MAX_UINT32 = 2**32-1
+MAX_UINT64 = 2**64-1
+
+GLUE1_TEMPLATE = '''GlueCEInfoLRMSVersion: %(lrmsVer)s
+GlueCEInfoTotalCPUs: %(totalCPU)d
+GlueCEPolicyAssignedJobSlots: %(totalCPU)d
+GlueCEStateFreeCPUs: %(freeCPU)d
+GlueCEPolicyMaxCPUTime: %(defaultCPUtime)d
+GlueCEPolicyMaxObtainableCPUTime: %(maxCPUtime)d
+GlueCEPolicyMaxTotalJobs: %(maxTotJobs)d
+GlueCEPolicyPriority: %(policyPriority)s
+GlueCEPolicyMaxRunningJobs: %(maxRunJobs)d
+GlueCEPolicyMaxWaitingJobs: %(maxWaitJobs)d
+GlueCEPolicyMaxWallClockTime: %(defaultWallTime)d
+GlueCEPolicyMaxObtainableWallClockTime: %(maxWallTime)d
+GlueCEPolicyMaxSlotsPerJob: %(maxProcCount)d
+GlueCEStateStatus: %(state)s
+
+'''
+
+MANAGER_TEMPLATE = '''GLUE2ManagerProductVersion: %(lrmsVer)s
+GLUE2EntityCreationTime: %(now)s
+GLUE2ComputingManagerTotalAcceleratorSlots: GPU:%(totalGPU)d
+GLUE2ComputingManagerUsedAcceleratorSlots: GPU:%(usedGPU)d
+
+'''
+
+GLUE2_TEMPLATE = '''GLUE2ComputingShareDefaultCPUTime: %(defaultCPUtime)d
+GLUE2ComputingShareMaxCPUTime: %(maxCPUtime)d
+GLUE2ComputingShareDefaultWallTime: %(defaultWallTime)d
+GLUE2ComputingShareMaxWallTime: %(maxWallTime)d
+GLUE2ComputingShareMaxSlotsPerJob: %(maxProcCount)d
+GLUE2ComputingShareMaxRunningJobs: %(maxRunJobs)d
+GLUE2ComputingShareMaxTotalJobs: %(maxTotJobs)d
+GLUE2ComputingShareMaxWaitingJobs: %(maxWaitJobs)d
+GLUE2ComputingShareMaxMainMemory: %(maxMem)d
+GLUE2ComputingShareMaxVirtualMemory: %(maxVMem)d
+GLUE2ComputingShareServingState: %(state)s
+GLUE2EntityCreationTime: %(now)s
+'''
+
+GLUE21_TEMPLATE = '''GLUE2ComputingShareFreeAcceleratorSlots: GPU:%(freeGPU)d
+GLUE2ComputingShareUsedAcceleratorSlots: GPU:%(usedGPU)d
+'''
+
+
+def _value(value, default, scale=1):
+    if value <> RES_UNDEF:
+        return value / scale
+    return default
+
+
+class GlueRenderer:
+
+    #
+    # The attribute block of a queue is built once, from the templates,
+    # and shared by all the DNs mapped to that queue; the whole output
+    # is sent with a single write
+    #
+    def __init__(self, qInfoHandlers, lrmsVer, cpuInfo, now, interfaceOff=False,
+                 enableGlue21=False, freeGPUSlots=0, usedGPUSlots=0):
+        self.qInfoHandlers = qInfoHandlers
+        self.interfaceOff = interfaceOff
+        self.commonValues = {
+            'lrmsVer' : lrmsVer,
+            'totalCPU' : cpuInfo.totalCPU,
+            'freeCPU' : cpuInfo.freeCPU,
+            'now' : now,
+            'freeGPU' : freeGPUSlots,
+            'usedGPU' : usedGPUSlots,
+            'totalGPU' : freeGPUSlots + usedGPUSlots
+        }
+        
+        self.glue2Template = GLUE2_TEMPLATE
+        if enableGlue21:
+            self.glue2Template += GLUE21_TEMPLATE
+        self.glue2Template += '\n'
+        
+        self.glue1Blocks = dict()
+        self.glue2Blocks = dict()
+        self.managerBlock = MANAGER_TEMPLATE % self.commonValues
+
+    def glue1Block(self, queue):
+        block = self.glue1Blocks.get(queue)
+        if block <> None:
+            return block
+        
+        qInfo = self.qInfoHandlers[queue]
+        values = dict(self.commonValues)
+        values['defaultCPUtime'] = _value(qInfo.defaultCPUtime, MAX_INT32, 60)
+        values['maxCPUtime'] = _value(qInfo.maxCPUtime, MAX_INT32, 60)
+        values['maxTotJobs'] = _value(qInfo.maxTotJobs, MAX_INT32)
+        values['policyPriority'] = qInfo.policyPriority or MAX_INT32
+        values['maxRunJobs'] = _value(qInfo.maxRunJobs, MAX_INT32)
+        if qInfo.maxTotJobs <> RES_UNDEF and qInfo.maxRunJobs <> RES_UNDEF:
+            values['maxWaitJobs'] = qInfo.maxTotJobs - qInfo.maxRunJobs
+        else:
+            values['maxWaitJobs'] = MAX_INT32
+        values['defaultWallTime'] = _value(qInfo.defaultWallTime, MAX_INT32, 60)
+        values['maxWallTime'] = _value(qInfo.maxWallTime, MAX_INT32, 60)
+        values['maxProcCount'] = _value(qInfo.maxProcCount, MAX_INT32)
+        if self.interfaceOff:
+            values['state'] = 'Draining'
+        else:
+            values['state'] = qInfo.state
+        
+        block = GLUE1_TEMPLATE % values
+        self.glue1Blocks[queue] = block
+        return block
+
+    def glue2Block(self, queue):
+        block = self.glue2Blocks.get(queue)
+        if block <> None:
+            return block
+        
+        qInfo = self.qInfoHandlers[queue]
+        values = dict(self.commonValues)
+        values['defaultCPUtime'] = _value(qInfo.defaultCPUtime, MAX_UINT64)
+        values['maxCPUtime'] = _value(qInfo.maxCPUtime, MAX_UINT64)
+        values['defaultWallTime'] = _value(qInfo.defaultWallTime, MAX_UINT64)
+        values['maxWallTime'] = _value(qInfo.maxWallTime, MAX_UINT64)
+        values['maxProcCount'] = _value(qInfo.maxProcCount, MAX_UINT32)
+        
+        # take maxjobs into consideration for max-running and max-waiting as well
+        maxjobs = _value(qInfo.maxTotJobs, MAX_UINT32)
+        values['maxRunJobs'] = _value(qInfo.maxRunJobs, maxjobs)
+        
+        #
+        # TODO get info per vo (vomaxjobs-*)
+        #      for the moment queue-wide values are used
+        #
+        values['maxTotJobs'] = maxjobs
+        if qInfo.maxTotJobs <> RES_UNDEF and qInfo.maxRunJobs <> RES_UNDEF:
+            values['maxWaitJobs'] = qInfo.maxTotJobs - qInfo.maxRunJobs
+        else:
+            values['maxWaitJobs'] = maxjobs
+        values['maxMem'] = _value(qInfo.maxMem, MAX_UINT64)
+        values['maxVMem'] = _value(qInfo.maxVMem, MAX_UINT64)
+        if self.interfaceOff:
+            values['state'] = 'draining'
+        else:
+            values['state'] = qInfo.state.lower()
+        
+        block = self.glue2Template % values
+        self.glue2Blocks[queue] = block
+        return block
+
+    def renderGlue1(self, glue1Table, chunks):
+        for glue1DN in glue1Table:
+            chunks.append(glue1DN + '\n')
+            chunks.append(self.glue1Block(glue1Table[glue1DN]))
+
+    def renderGlue2(self, glue2Table, managerTable, chunks):
+        if managerTable:
+            for managerDN in managerTable:
+                chunks.append(managerDN + '\n')
+                chunks.append(self.managerBlock)
+        
+        for glue2DN in glue2Table:
+            chunks.append(glue2DN + '\n')
+            chunks.append(self.glue2Block(glue2Table[glue2DN]))
+
+    def render(self, out, glue1Table=None, glue2Table=None, managerTable=None):
+        chunks = list()
+        if glue1Table:
+            self.renderGlue1(glue1Table, chunks)
+        if glue2Table or managerTable:
+            self.renderGlue2(glue2Table or dict(), managerTable, chunks)
+        out.write(''.join(chunks))
+        out.flush()
@@ -0,0 +1,128 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import json
+import ast
+import logging
+
+logger = logging.getLogger("JobFormat")
+
+FORMATS = ['dict', 'json', 'tsv']
+
+#
+# column layout of the tsv format, the header line starts with '#'
+#
+TSV_FIELDS = ['jobid', 'name', 'user', 'group', 'state', 'queue', 'qtime',
+              'start', 'startAnchor', 'walltime', 'maxwalltime', 'cpucount']
+
+TSV_INT_FIELDS = frozenset(['qtime', 'start', 'walltime', 'maxwalltime', 'cpucount'])
+
+BUFFER_LINES = 4096
+
+
+class JobWriter:
+
+    def __init__(self, stream, fmt='dict'):
+        if not fmt in FORMATS:
+            raise Exception("Unknown output format: %s" % fmt)
+        self.stream = stream
+        self.fmt = fmt
+        self.buffer = list()
+        self.headerDone = False
+        
+        if fmt == 'json':
+            self.encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def _tsvLine(self, jTable):
+        tmpl = list()
+        for key in TSV_FIELDS:
+            value = jTable.get(key)
+            if value == None:
+                tmpl.append('')
+            else:
+                tmpl.append(str(value))
+        return '\t'.join(tmpl) + '\n'
+
+    def write(self, jTable):
+        if self.fmt == 'dict':
+            self.buffer.append(str(jTable) + '\n')
+        elif self.fmt == 'json':
+            self.buffer.append(self.encoder.encode(dict(jTable.items())) + '\n')
+        else:
+            if not self.headerDone:
+                self.buffer.append('#' + '\t'.join(TSV_FIELDS) + '\n')
+                self.headerDone = True
+            self.buffer.append(self._tsvLine(jTable))
+        
+        if len(self.buffer) >= BUFFER_LINES:
+            self.flush()
+
+    # same interface of the containers used by QStatHandler.parse
+    append = write
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write(''.join(self.buffer))
+            self.buffer = list()
+        self.stream.flush()
+
+
+def _readTSVLine(line, fields):
+    jTable = dict()
+    for key, value in zip(fields, line.rstrip('\n').split('\t')):
+        if value == '':
+            continue
+        if key in TSV_INT_FIELDS:
+            jTable[key] = int(value)
+        else:
+            jTable[key] = value
+    return jTable
+
+
+def readLRMSInfo(stream):
+
+    #
+    # Parses the output of lrmsinfo-pbs in any of the supported formats,
+    # returns the table of the header items and the list of jobs
+    #
+    infoTable = dict()
+    jobList = list()
+    fields = None
+    decoder = json.JSONDecoder()
+    
+    for line in stream:
+        if line.startswith('{"'):
+            jTable = dict()
+            for key, value in decoder.decode(line).items():
+                # json strings are decoded as unicode
+                if isinstance(value, unicode):
+                    value = value.encode('utf-8')
+                jTable[key.encode('utf-8')] = value
+            jobList.append(jTable)
+        elif line.startswith('{'):
+            jobList.append(ast.literal_eval(line))
+        elif line.startswith('#'):
+            fields = line[1:].rstrip('\n').split('\t')
+        elif fields:
+            jobList.append(_readTSVLine(line, fields))
+        else:
+            tmpl = line.split(None, 1)
+            if len(tmpl) == 2:
+                infoTable[tmpl[0]] = tmpl[1].strip()
+    
+    return infoTable, jobList
+
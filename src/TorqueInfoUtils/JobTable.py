@@ -0,0 +1,239 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import array
+import logging
+
+from TorqueInfoUtils import QStatHandler
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger("JobTable")
+
+#
+# Columnar store for the jobs produced by PBSJobHandler: numeric
+# attributes are kept in machine arrays, queue, group and state
+# as integer codes of per-column dictionaries.
+# Each column has a mask of the jobs where the attribute is defined,
+# a missing numeric attribute is stored as zero.
+#
+
+NUMERIC_FIELDS = ('qtime', 'start', 'walltime', 'maxwalltime', 'cpucount')
+CODED_FIELDS = ('queue', 'group', 'state')
+
+AGGREGATES = ('count', 'sum', 'min', 'max')
+
+
+class JobTable:
+
+    def __init__(self):
+        self.size = 0
+        self.columns = dict()
+        self.masks = dict()
+        for field in NUMERIC_FIELDS:
+            self.columns[field] = array.array('l')
+            self.masks[field] = array.array('B')
+        self.codes = dict()
+        self.codeTables = dict()
+        self.valueTables = dict()
+        for field in CODED_FIELDS:
+            self.codes[field] = array.array('i')
+            self.masks[field] = array.array('B')
+            self.codeTables[field] = dict()
+            self.valueTables[field] = list()
+
+    def __len__(self):
+        return self.size
+
+    def _encode(self, field, value):
+        codeTable = self.codeTables[field]
+        code = codeTable.get(value)
+        if code == None:
+            code = len(self.valueTables[field])
+            codeTable[value] = code
+            self.valueTables[field].append(value)
+        return code
+
+    def append(self, jTable):
+        #
+        # container interface of PBSJobHandler, the record is not kept
+        #
+        for field in NUMERIC_FIELDS:
+            value = jTable.get(field)
+            self.masks[field].append(value <> None)
+            self.columns[field].append(value or 0)
+        for field in CODED_FIELDS:
+            value = jTable.get(field)
+            self.masks[field].append(value <> None)
+            self.codes[field].append(self._encode(field, value))
+        self.size += 1
+
+    def _asNumpy(self, data):
+        if len(data) == 0:
+            return numpy.zeros(0, data.typecode)
+        return numpy.frombuffer(data, data.typecode)
+
+    def column(self, field):
+        if field in self.columns:
+            data = self.columns[field]
+        else:
+            data = self.codes[field]
+        if numpy <> None:
+            return self._asNumpy(data)
+        return data
+
+    def mask(self, field):
+        #
+        # true where field is defined
+        #
+        if numpy <> None:
+            return self._asNumpy(self.masks[field]).astype(bool)
+        return self.masks[field]
+
+    def values(self, field):
+        return self.valueTables[field]
+
+    def groupBy(self, keys, func='count', field=None):
+        
+        #
+        # Aggregates field over the groups of jobs sharing the values
+        # of the coded fields in keys; with a field the jobs where it
+        # is undefined are skipped, a coded field can only be counted.
+        # The result maps the key value, or the tuple of values for
+        # many keys, to the aggregate.
+        #
+        if isinstance(keys, basestring):
+            keys = (keys,)
+            single = True
+        else:
+            keys = tuple(keys)
+            single = False
+        
+        if func not in AGGREGATES:
+            raise Exception("Unknown aggregate: %s" % func)
+        if field == None and func <> 'count':
+            raise Exception("Missing field for aggregate %s" % func)
+        if field <> None and not field in self.masks:
+            raise Exception("Unknown field: %s" % field)
+        if field in CODED_FIELDS and func <> 'count':
+            raise Exception("Aggregate %s of the coded field %s" % (func, field))
+        
+        if numpy <> None:
+            groups = self._numpyGroupBy(keys, func, field)
+        else:
+            groups = self._arrayGroupBy(keys, func, field)
+        
+        result = dict()
+        for codeTuple, value in groups:
+            keyValue = tuple([ self.valueTables[key][code] for key, code in zip(keys, codeTuple) ])
+            if single:
+                keyValue = keyValue[0]
+            result[keyValue] = value
+        return result
+
+    def _numpyGroupBy(self, keys, func, field):
+        #
+        # the codes of the keys are combined into a single
+        # mixed-radix code, the groups are runs of the sorted codes
+        #
+        radix = [ max(len(self.valueTables[key]), 1) for key in keys ]
+        
+        groupCodes = numpy.zeros(self.size, numpy.int64)
+        for key, base in zip(keys, radix):
+            groupCodes = groupCodes * base + self.column(key)
+        
+        if field <> None:
+            mask = self.mask(field)
+            groupCodes = groupCodes[mask]
+            data = self.column(field)[mask]
+        
+        if len(groupCodes) == 0:
+            return list()
+        
+        order = numpy.argsort(groupCodes, kind='mergesort')
+        groupCodes = groupCodes[order]
+        starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(groupCodes)) + 1))
+        
+        if func == 'count':
+            results = numpy.diff(numpy.append(starts, len(groupCodes)))
+        else:
+            data = data[order]
+            if func == 'sum':
+                results = numpy.add.reduceat(data, starts)
+            elif func == 'min':
+                results = numpy.minimum.reduceat(data, starts)
+            else:
+                results = numpy.maximum.reduceat(data, starts)
+        
+        groups = list()
+        for groupCode, value in zip(groupCodes[starts].tolist(), results.tolist()):
+            codeTuple = list()
+            for base in reversed(radix):
+                codeTuple.append(groupCode % base)
+                groupCode = groupCode // base
+            codeTuple.reverse()
+            groups.append((tuple(codeTuple), value))
+        return groups
+
+    def _arrayGroupBy(self, keys, func, field):
+        keyColumns = [ self.codes[key] for key in keys ]
+        if len(keys) == 1:
+            groupKeys = [ (code,) for code in keyColumns[0] ]
+        else:
+            groupKeys = zip(*keyColumns)
+        
+        results = dict()
+        if field == None:
+            for groupKey in groupKeys:
+                results[groupKey] = results.get(groupKey, 0) + 1
+            return results.items()
+        
+        if field in self.columns:
+            data = self.columns[field]
+        else:
+            data = self.codes[field]
+        
+        for groupKey, value, defined in zip(groupKeys, data, self.masks[field]):
+            if not defined:
+                continue
+            if not groupKey in results:
+                if func == 'count':
+                    results[groupKey] = 1
+                else:
+                    results[groupKey] = value
+            elif func == 'count':
+                results[groupKey] += 1
+            elif func == 'sum':
+                results[groupKey] += value
+            elif func == 'min':
+                results[groupKey] = min(results[groupKey], value)
+            else:
+                results[groupKey] = max(results[groupKey], value)
+        return results.items()
+
+
+def parse(pbsHost=None, filename=None, groupResolver=None):
+
+    #
+    # The parser feeds the table directly, the job
+    # records are dropped as soon as they are stored
+    #
+    table = JobTable()
+    QStatHandler.parse(table, pbsHost, filename, groupResolver, True)
+    return table
@@ -36,6 +36,9 @@ class DiagnoseHandler(Thread):
     def setStream(self, stream):
         self.stream = stream
 
+    def __getstate__(self):
+        return CommonUtils.handlerState(self)
+
     def run(self):
         gpos = -1
         lpos = -1
@@ -77,8 +80,9 @@ class DiagnoseHandler(Thread):
 
 
 def parseJobLimit(pbsHost=None, keyfile=None, filename=None):
+    container = DiagnoseHandler()
     if filename:
-        cmd = shlex.split('cat ' + filename)
+        CommonUtils.parseFile(filename, container)
     else:
         tmps = 'diagnose -g'
         if pbsHost:
@@ -86,9 +90,7 @@ def parseJobLimit(pbsHost=None, keyfile=None, filename=None):
         if keyfile:
             tmps += ' --keyfile=%s' % keyfile
         cmd = shlex.split(tmps)
-
-    container = DiagnoseHandler()
-    CommonUtils.parseStream(cmd, container)
+        CommonUtils.parseStream(cmd, container)
     return container
 
 
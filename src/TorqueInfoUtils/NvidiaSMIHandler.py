@@ -18,9 +18,16 @@ import sys
 import re
 import time
 import shlex
+import os, os.path
+import stat
+import socket
+import signal
+import tempfile
 import subprocess
+import cPickle
 import logging
-from threading import Thread
+import Queue
+from threading import Thread, Lock
 
 from TorqueInfoUtils import CommonUtils
 
@@ -56,10 +63,151 @@ class GPUInfoHandler(Thread):
             self.errList.append(CommonUtils.errorMsgFromTrace())
 
 
-def parseGPUInfo(cudaHost, filename=None):
+DEFAULT_SSH_PERSIST = 600
+
+class SSHTransport:
+
+    def __init__(self, controlDir=None, persist=DEFAULT_SSH_PERSIST):
+        if controlDir:
+            self.controlDir = controlDir
+        else:
+            self.controlDir = os.path.join(tempfile.gettempdir(), 'idpbs-ssh-%d' % os.getuid())
+        self.persist = persist
+        self.baseOpts = ['-o', 'PasswordAuthentication=no']
+        self._checkControlDir()
+
+    def _checkControlDir(self):
+        if not os.path.isdir(self.controlDir):
+            os.makedirs(self.controlDir, 0700)
+        dirStat = os.stat(self.controlDir)
+        if dirStat.st_uid <> os.getuid() or stat.S_IMODE(dirStat.st_mode) & 077:
+            raise Exception("Insecure ssh control directory " + self.controlDir)
+
+    def controlPath(self, host):
+        return os.path.join(self.controlDir, host)
+
+    def _isAlive(self, path):
+        tmpsock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                tmpsock.connect(path)
+                return True
+            except socket.error:
+                return False
+        finally:
+            tmpsock.close()
+
+    def _startMaster(self, host, deadline=None):
+        cmd = ['ssh'] + self.baseOpts
+        if deadline:
+            cmd += ['-o', 'ConnectTimeout=%d' % max(1, int(deadline - time.time()))]
+        cmd += ['-o', 'ControlMaster=yes',
+                '-o', 'ControlPath=' + self.controlPath(host),
+                '-o', 'ControlPersist=%d' % self.persist,
+                '-f', '-N', host]
+        
+        logger.debug("Starting ssh master: " + repr(cmd))
+        
+        devnull = open(os.devnull, 'r+')
+        try:
+            #
+            # ssh and its children get their own process group,
+            # the master leaves it with -f once it is connected
+            #
+            process = subprocess.Popen(cmd, stdin=devnull, stdout=devnull,
+                                       stderr=devnull, preexec_fn=os.setsid)
+        finally:
+            devnull.close()
+        
+        retcode = process.poll()
+        while retcode == None and (not deadline or time.time() < deadline):
+            time.sleep(0.05)
+            retcode = process.poll()
+        
+        if retcode == None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            process.wait()
+            raise CommonUtils.CommandTimeout("Timeout starting ssh master for " + host)
+        
+        if retcode <> 0:
+            raise Exception("Cannot start ssh master for %s (exit code %d)" % (host, retcode))
+
+    def command(self, host, remoteCmd, deadline=None):
+        path = self.controlPath(host)
+        
+        if os.path.exists(path) and not self._isAlive(path):
+            os.remove(path)
+        
+        #
+        # a master that cannot be started fails the probe: a second
+        # plain connection to the same host would fail or hang as well
+        #
+        if not os.path.exists(path):
+            self._startMaster(host, deadline)
+        if os.path.exists(path):
+            os.utime(path, None)
+
+        return ['ssh'] + self.baseOpts + ['-o', 'ControlMaster=no',
+                                          '-o', 'ControlPath=' + path,
+                                          host, remoteCmd]
+
+    def _closeMaster(self, host):
+        path = self.controlPath(host)
+        cmd = ['ssh', '-o', 'ControlPath=' + path, '-O', 'exit', host]
+        devnull = open(os.devnull, 'r+')
+        try:
+            try:
+                subprocess.call(cmd, stdin=devnull, stdout=devnull, stderr=devnull)
+            except:
+                logger.debug("Cannot stop ssh master for %s" % host, exc_info=True)
+        finally:
+            devnull.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+    def cleanup(self, activeHosts=None):
+        now = time.time()
+        evicted = 0
+        
+        for host in os.listdir(self.controlDir):
+            path = self.controlPath(host)
+            try:
+                if not self._isAlive(path):
+                    os.remove(path)
+                    evicted += 1
+                elif (activeHosts <> None and not host in activeHosts) \
+                    or now - os.path.getmtime(path) > self.persist:
+                    self._closeMaster(host)
+                    evicted += 1
+            except:
+                logger.debug("Cannot clean up %s" % path, exc_info=True)
+        
+        logger.debug("Evicted %d ssh control sockets" % evicted)
+        return evicted
+
+
+def parseGPUInfo(cudaHost, filename=None, transport=None):
+
+    container = GPUInfoHandler()
 
     if filename:
-        cmd = shlex.split('cat ' + filename)
+        CommonUtils.parseFile(filename, container)
+        return container
+
+    #
+    # the ssh timeout covers the whole probe, master startup included
+    #
+    timeout = CommonUtils.COMMAND_TIMEOUTS.get('ssh')
+    deadline = None
+    if timeout:
+        deadline = time.time() + timeout
+
+    if transport:
+        smi_cmd = 'nvidia-smi --query-compute-apps=gpu_uuid,pid --format=csv,noheader'
+        cmd = transport.command(cudaHost, smi_cmd, deadline)
     else:
         smi_cmd = '"nvidia-smi --query-compute-apps=gpu_uuid,pid --format=csv,noheader"'
         ssh_opts = '-o PasswordAuthentication=no'
@@ -67,7 +215,349 @@ def parseGPUInfo(cudaHost, filename=None):
             
     logger.debug("Calling executable: " + repr(cmd))
 
-    container = GPUInfoHandler()
-    CommonUtils.parseStream(cmd, container)
+    if deadline:
+        timeout = deadline - time.time()
+        if timeout <= 0:
+            raise CommonUtils.CommandTimeout("Timeout probing " + cudaHost, container)
+    CommonUtils.parseStream(cmd, container, timeout)
     return container
 
+
+
+DEFAULT_CACHE_AGE = 600
+
+class GPUResultCache:
+
+    #
+    # The nvidia-smi results of each node, valid while the node
+    # fingerprint (jobs and gpu_status from pbsnodes) is unchanged
+    # and for at most maxAge seconds
+    #
+    def __init__(self, cacheFile=None, maxAge=DEFAULT_CACHE_AGE):
+        self.cacheFile = cacheFile
+        self.maxAge = maxAge
+        self.table = dict()
+        self.lock = Lock()
+        self.hits = 0
+        
+        if cacheFile:
+            self.load()
+
+    def load(self):
+        cFile = None
+        try:
+            try:
+                cFile = CommonUtils.openPrivateFile(self.cacheFile)
+                self.table = cPickle.load(cFile)
+            except IOError:
+                pass
+            except:
+                logger.debug("Cannot read GPU cache %s" % self.cacheFile, exc_info=True)
+        finally:
+            if cFile:
+                cFile.close()
+
+    def save(self, activeNodes=None):
+        #
+        # late probes may still be running after a deadline
+        #
+        self.lock.acquire()
+        try:
+            self._save(activeNodes)
+        finally:
+            self.lock.release()
+
+    def _save(self, activeNodes):
+        if activeNodes <> None:
+            activeNodes = set(activeNodes)
+            for nodeName in self.table.keys():
+                if not nodeName in activeNodes:
+                    del self.table[nodeName]
+        
+        if not self.cacheFile:
+            return
+        
+        try:
+            CommonUtils.writeAtomically(self.cacheFile,
+                                        lambda cFile: cPickle.dump(self.table, cFile,
+                                                                   cPickle.HIGHEST_PROTOCOL),
+                                        'gpus')
+        except:
+            logger.debug("Cannot write GPU cache %s" % self.cacheFile, exc_info=True)
+
+    def lookup(self, nodeName, fingerprint):
+        if fingerprint == None:
+            return None
+        
+        self.lock.acquire()
+        try:
+            item = self.table.get(nodeName)
+            if item and item[0] == fingerprint and 0 <= time.time() - item[1] <= self.maxAge:
+                self.hits += 1
+                return item[2]
+            return None
+        finally:
+            self.lock.release()
+
+    def store(self, nodeName, fingerprint, num_of_procs):
+        if fingerprint == None:
+            return
+        
+        self.lock.acquire()
+        try:
+            self.table[nodeName] = (fingerprint, time.time(), num_of_procs)
+        finally:
+            self.lock.release()
+
+
+DEFAULT_BREAKER_DELAY = 60
+DEFAULT_BREAKER_MAX_DELAY = 3600
+
+class GPUCircuitBreaker:
+
+    #
+    # Failure tracking per node: after a failed probe the node is not
+    # probed again for delay seconds, doubled at each new failure up
+    # to maxDelay; a successful probe closes the circuit.
+    # With a state file the table is shared among runs.
+    #
+    def __init__(self, stateFile=None, delay=DEFAULT_BREAKER_DELAY, maxDelay=DEFAULT_BREAKER_MAX_DELAY):
+        self.stateFile = stateFile
+        self.delay = delay
+        self.maxDelay = maxDelay
+        self.failures = dict()
+        self.retryTimes = dict()
+        self.lock = Lock()
+        self.modified = False
+        
+        if stateFile:
+            self.load()
+
+    def load(self):
+        sFile = None
+        try:
+            try:
+                sFile = open(self.stateFile)
+                for line in sFile:
+                    tmpl = line.rstrip('\n').split('\t')
+                    if len(tmpl) <> 3:
+                        continue
+                    self.failures[tmpl[0]] = int(tmpl[1])
+                    self.retryTimes[tmpl[0]] = int(tmpl[2])
+            except IOError:
+                pass
+            except:
+                logger.debug("Cannot read circuit state %s" % self.stateFile, exc_info=True)
+        finally:
+            if sFile:
+                sFile.close()
+
+    def save(self, activeNodes=None):
+        #
+        # late probes may still be running after a deadline
+        #
+        self.lock.acquire()
+        try:
+            self._save(activeNodes)
+        finally:
+            self.lock.release()
+
+    def _save(self, activeNodes):
+        if activeNodes <> None:
+            activeNodes = set(activeNodes)
+            for nodeName in self.failures.keys():
+                if not nodeName in activeNodes:
+                    del self.failures[nodeName]
+                    del self.retryTimes[nodeName]
+                    self.modified = True
+        
+        if not self.stateFile or not self.modified:
+            return
+        
+        def writeState(sFile):
+            for nodeName, failures in self.failures.items():
+                sFile.write('%s\t%d\t%d\n' % (nodeName, failures, self.retryTimes[nodeName]))
+        
+        try:
+            CommonUtils.writeAtomically(self.stateFile, writeState, 'circuits')
+            self.modified = False
+        except:
+            logger.debug("Cannot write circuit state %s" % self.stateFile, exc_info=True)
+
+    def isOpen(self, nodeName):
+        self.lock.acquire()
+        try:
+            return nodeName in self.retryTimes and time.time() < self.retryTimes[nodeName]
+        finally:
+            self.lock.release()
+
+    def registerFailure(self, nodeName):
+        self.lock.acquire()
+        try:
+            failures = self.failures.get(nodeName, 0) + 1
+            backoff = min(self.delay * 2 ** min(failures - 1, 30), self.maxDelay)
+            self.failures[nodeName] = failures
+            self.retryTimes[nodeName] = int(time.time() + backoff)
+            self.modified = True
+            logger.debug("Circuit open for %s (%d failures), retry in %ds" % (nodeName, failures, backoff))
+        finally:
+            self.lock.release()
+
+    def registerSuccess(self, nodeName):
+        self.lock.acquire()
+        try:
+            if nodeName in self.failures:
+                del self.failures[nodeName]
+                del self.retryTimes[nodeName]
+                self.modified = True
+        finally:
+            self.lock.release()
+
+
+DEFAULT_MAX_PROBES = 16
+
+class GPUProbeWorker(Thread):
+
+    def __init__(self, engine, nodeQueue):
+        Thread.__init__(self)
+        self.engine = engine
+        self.nodeQueue = nodeQueue
+
+    def run(self):
+        while True:
+            if self.engine.deadline <> None and time.time() >= self.engine.deadline:
+                return
+            
+            try:
+                nodeName, gpuStats = self.nodeQueue.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                smiHandler = parseGPUInfo(nodeName, None, self.engine.transport)
+                self.engine.registerResult(nodeName, gpuStats, smiHandler.num_of_procs)
+                if self.engine.cache:
+                    self.engine.cache.store(nodeName, gpuStats.get('fingerprint'), smiHandler.num_of_procs)
+                if self.engine.breaker:
+                    self.engine.breaker.registerSuccess(nodeName)
+            except Exception, ex:
+                logger.debug("Error probing GPUs on %s" % nodeName, exc_info=True)
+                self.engine.registerFailure(nodeName, gpuStats, ex)
+                if self.engine.breaker:
+                    self.engine.breaker.registerFailure(nodeName)
+
+
+class GPUProbeEngine:
+
+    def __init__(self, maxProbes=DEFAULT_MAX_PROBES, transport=None, cache=None, breaker=None):
+        self.maxProbes = max(1, maxProbes)
+        self.transport = transport
+        self.cache = cache
+        self.breaker = breaker
+        self.deadline = None
+        self.freeGPUSlots = 0
+        self.usedGPUSlots = 0
+        self.skipped = 0
+        self.expired = 0
+        self.errList = list()
+        self.lock = Lock()
+        self.done = set()
+        self.closed = False
+
+    def registerResult(self, nodeName, gpuStats, num_of_procs):
+        tmpSlots = gpuStats['total_gpus']
+        for nProcs in num_of_procs.values():
+            if nProcs > 0:
+                tmpSlots -= 1
+
+        self.lock.acquire()
+        try:
+            if self.closed or nodeName in self.done:
+                return
+            self.done.add(nodeName)
+            self.freeGPUSlots += tmpSlots
+            self.usedGPUSlots += gpuStats['total_gpus'] - tmpSlots
+        finally:
+            self.lock.release()
+
+    def registerFailure(self, nodeName, gpuStats, error):
+        #
+        # fall back to the figures reported by pbsnodes
+        #
+        self.lock.acquire()
+        try:
+            if self.closed or nodeName in self.done:
+                return
+            self.done.add(nodeName)
+            if error <> None:
+                self.errList.append(repr(error))
+            self.freeGPUSlots += gpuStats['free_gpus']
+            self.usedGPUSlots += gpuStats['total_gpus'] - gpuStats['free_gpus']
+        finally:
+            self.lock.release()
+
+    def probe(self, gpuTable, deadline=None):
+        #
+        # with a deadline the nodes not probed in time get the
+        # pbsnodes figures; late results are discarded
+        #
+        self.deadline = deadline
+        nodeQueue = Queue.Queue()
+        probedNodes = list()
+
+        for nodeName in gpuTable:
+            gpuStats = gpuTable[nodeName]
+            nodeState = gpuStats['node_state']
+            if 'down' in nodeState or 'offline' in nodeState or 'unknown' in nodeState:
+                continue
+            
+            if self.cache:
+                num_of_procs = self.cache.lookup(nodeName, gpuStats.get('fingerprint'))
+                if num_of_procs <> None:
+                    self.registerResult(nodeName, gpuStats, num_of_procs)
+                    continue
+            
+            if self.breaker and self.breaker.isOpen(nodeName):
+                self.registerFailure(nodeName, gpuStats, None)
+                self.skipped += 1
+                continue
+            
+            nodeQueue.put((nodeName, gpuStats))
+            probedNodes.append(nodeName)
+
+        workers = list()
+        for idx in range(min(self.maxProbes, nodeQueue.qsize())):
+            worker = GPUProbeWorker(self, nodeQueue)
+            worker.setDaemon(True)
+            worker.start()
+            workers.append(worker)
+
+        for worker in workers:
+            if deadline <> None:
+                worker.join(max(deadline - time.time(), 0))
+            else:
+                worker.join()
+
+        self.lock.acquire()
+        try:
+            for nodeName in probedNodes:
+                if not nodeName in self.done:
+                    gpuStats = gpuTable[nodeName]
+                    self.freeGPUSlots += gpuStats['free_gpus']
+                    self.usedGPUSlots += gpuStats['total_gpus'] - gpuStats['free_gpus']
+                    self.expired += 1
+            self.closed = True
+        finally:
+            self.lock.release()
+
+        if self.transport and not self.expired:
+            self.transport.cleanup(gpuTable.keys())
+
+        if self.cache:
+            self.cache.save(gpuTable.keys())
+
+        if self.breaker:
+            self.breaker.save(gpuTable.keys())
+
+        logger.debug("GPU probes: %d nodes, %d workers, %d errors, %d skipped (open circuit), %d expired" 
+                     % (len(gpuTable), len(workers), len(self.errList), self.skipped, self.expired))
@@ -16,6 +16,8 @@
 
 import sys
 import re
+import array
+import hashlib
 import time
 import shlex
 import subprocess
@@ -26,6 +28,76 @@ from TorqueInfoUtils import CommonUtils
 
 logger = logging.getLogger("PBSNodesHandler")
 
+def isNodeUp(state):
+    return not ('down' in state or 'offline' in state or 'unknown' in state)
+
+
+class NodeRecord(object):
+
+    #
+    # Compact description of a node; the slots of the running jobs are
+    # stored in an array, jobIds has the job for each slot
+    #
+    __slots__ = ('name', 'state', 'np', 'properties', 'jobSlots', 'jobIds',
+                 'totalGPUs', 'freeGPUs')
+
+    def __init__(self, name):
+        self.name = name
+        self.state = None
+        self.np = 0
+        self.properties = ()
+        self.jobSlots = array.array('H')
+        self.jobIds = ()
+        self.totalGPUs = 0
+        self.freeGPUs = 0
+
+    def isUp(self):
+        return self.state <> None and isNodeUp(self.state)
+
+    def usedSlots(self):
+        return len(self.jobSlots)
+
+    def freeSlots(self):
+        return max(self.np - len(self.jobSlots), 0)
+
+    def __repr__(self):
+        return 'NodeRecord(%s, %s, np=%d, jobs=%d)' % (self.name, self.state, self.np, len(self.jobSlots))
+
+
+def parseJobSlots(value):
+
+    #
+    # "0/15.host, 1/16.host" (Torque 2) or "0-3,5/15.host,4/16.host"
+    # (Torque 4): slot ranges without a job belong to the next job
+    #
+    jobSlots = array.array('H')
+    jobIds = list()
+    pending = list()
+    
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        
+        slots, sep, jobid = item.partition('/')
+        pending.append(slots)
+        if not sep:
+            continue
+        
+        for slotSpec in pending:
+            first, sep, last = slotSpec.partition('-')
+            if sep:
+                slotRange = range(int(first), int(last) + 1)
+            else:
+                slotRange = [ int(first) ]
+            for slot in slotRange:
+                jobSlots.append(slot)
+                jobIds.append(jobid)
+        pending = list()
+    
+    return jobSlots, tuple(jobIds)
+
+
 class CPUInfoHandler(Thread):
 
     def __init__(self):
@@ -36,14 +108,25 @@ class CPUInfoHandler(Thread):
         self.pRegex = re.compile('^\s*([^=\s]+)\s*=(.+)$')
         self.gpuRegex = re.compile('gpu\[\d*\]\s*=\s*')
         self.gpuTable = dict()
+        self.nodes = dict()
+        self.propertyIndex = dict()
     
     def setStream(self, stream):
         self.stream = stream
+
+    def __getstate__(self):
+        return CommonUtils.handlerState(self)
+
+    def node(self, name):
+        return self.nodes.get(name)
+
+    def nodesWithProperty(self, prop):
+        return self.propertyIndex.get(prop, [])
       
     def run(self):
     
-        currState = None
         currNode = None
+        currRecord = None
         
         try:
             line = self.stream.readline()
@@ -53,30 +136,38 @@ class CPUInfoHandler(Thread):
                 
                     logger.debug("Detected item: %s" % line.strip())
                     
+                    if currRecord == None or currRecord.name <> currNode:
+                        currRecord = NodeRecord(currNode)
+                        self.nodes[currNode] = currRecord
+                    
                     if parsed.group(1) == 'state':
                 
-                        currState = parsed.group(2).strip()
+                        currRecord.state = intern(parsed.group(2).strip())
                 
                     elif parsed.group(1) == 'np':
                 
-                        procNum = int(parsed.group(2).strip())
-                        if not ('down' in currState or 'offline' in currState or 'unknown' in currState):
-                            self.totalCPU += procNum
-                        if currState == 'free':
-                            self.freeCPU += procNum
+                        currRecord.np = int(parsed.group(2).strip())
+                
+                    elif parsed.group(1) == 'properties':
+                    
+                        currRecord.properties = tuple([ intern(prop.strip()) 
+                                                        for prop in parsed.group(2).split(',') if prop.strip() ])
                 
                     elif parsed.group(1) == 'jobs':
                     
-                        jobList = parsed.group(2).strip()
-                        if currState == 'free' and len(jobList) > 0:
-                            self.freeCPU -= jobList.count(',') + 1
+                        currRecord.jobSlots, currRecord.jobIds = parseJobSlots(parsed.group(2))
 
                     elif parsed.group(1) == 'gpu_status':
 
-                        gpuNodeInfo = dict()
-                        gpuNodeInfo['node_state'] = currState
-                        gpuNodeInfo['total_gpus'] = 0
-                        gpuNodeInfo['free_gpus'] = 0
+                        currRecord.totalGPUs = 0
+                        currRecord.freeGPUs = 0
+                        
+                        #
+                        # timestamp, temperature and memory used change at every
+                        # update of the MOM: the signature has only mode, state
+                        # and usage of each GPU
+                        #
+                        gpuSignature = list()
 
                         for gpuStats in self.gpuRegex.split(parsed.group(2).strip()):
 
@@ -86,18 +177,26 @@ class CPUInfoHandler(Thread):
 
                             curr_gpu_use = 100
                             curr_mem_use = 100
+                            curr_mode = ''
+                            curr_state = ''
                             for pStr in gpuStats.split(';'):
                                 res = self.pRegex.match(pStr)
                                 if res.group(1) == 'gpu_utilization':
                                     curr_gpu_use = int(re.match('\d+', res.group(2)).group(0))
                                 elif res.group(1) == 'gpu_memory_utilization':
                                     curr_mem_use = int(re.match('\d+', res.group(2)).group(0))
+                                elif res.group(1) == 'gpu_mode':
+                                    curr_mode = res.group(2).split(',')[0].strip()
+                                elif res.group(1) == 'gpu_state':
+                                    curr_state = res.group(2).split(',')[0].strip()
                             
-                            if curr_gpu_use == 0 and curr_mem_use ==0:
-                                gpuNodeInfo['free_gpus'] += 1
-                            gpuNodeInfo['total_gpus'] += 1
+                            gpuFree = curr_gpu_use == 0 and curr_mem_use ==0
+                            if gpuFree:
+                                currRecord.freeGPUs += 1
+                            currRecord.totalGPUs += 1
+                            gpuSignature.append('%s:%s:%s' % (curr_mode, curr_state, gpuFree))
 
-                        self.gpuTable[currNode] = gpuNodeInfo
+                        self.gpuTable[currNode] = ';'.join(gpuSignature)
 
                 else:
                     tmps = line.strip()
@@ -105,25 +204,62 @@ class CPUInfoHandler(Thread):
                         currNode = tmps
 
                 line = self.stream.readline()
+            
+            self.finalize()
         
         except:
             logger.debug("Error parsing pbsnodes output", exc_info=True)
             self.errList.append(CommonUtils.errorMsgFromTrace())
 
+    def finalize(self):
+    
+        #
+        # the totals, the GPU table and the property index
+        # are derived from the node records
+        #
+        self.totalCPU = 0
+        self.freeCPU = 0
+        self.propertyIndex = dict()
+        
+        for record in self.nodes.itervalues():
+        
+            if record.state <> None and isNodeUp(record.state):
+                self.totalCPU += record.np
+            if record.state == 'free':
+                self.freeCPU += record.np - len(record.jobSlots)
+            
+            for prop in record.properties:
+                self.propertyIndex.setdefault(prop, list()).append(record)
+            
+            if record.name in self.gpuTable:
+                #
+                # the GPU usage changes only with the jobs or the GPU signature
+                #
+                fingerprint = hashlib.md5(','.join(record.jobIds))
+                fingerprint.update('|' + self.gpuTable[record.name])
+                self.gpuTable[record.name] = {
+                    'node_state' : record.state,
+                    'total_gpus' : record.totalGPUs,
+                    'free_gpus' : record.freeGPUs,
+                    'fingerprint' : fingerprint.hexdigest()
+                }
+
 
 def parseCPUInfo(pbsHost=None, filename=None):
 
+    container = CPUInfoHandler()
+
     if filename:
-        cmd = shlex.split('cat ' + filename)
+        CommonUtils.parseFile(filename, container)
+        return container
+
+    if pbsHost:
+        cmd = shlex.split('pbsnodes -a -s %s' % pbsHost)
     else:
-        if pbsHost:
-            cmd = shlex.split('pbsnodes -a -s %s' % pbsHost)
-        else:
-            cmd = shlex.split('pbsnodes -a')
+        cmd = shlex.split('pbsnodes -a')
             
     logger.debug("Calling executable: " + repr(cmd))
 
-    container = CPUInfoHandler()
     CommonUtils.parseStream(cmd, container)
     return container
     
@@ -15,10 +15,12 @@
 # limitations under the License.
 
 import sys
+import os, os.path
 import re
 import time
 import shlex
-from threading import Thread
+import cPickle
+from threading import Thread, Lock
 import pwd
 import grp
 import logging
@@ -27,42 +29,286 @@ from TorqueInfoUtils import CommonUtils
 
 logger = logging.getLogger("QStatHandler")
 
+def convertState(state):
+    if state == 'Q' or state == 'W':
+        return 'queued'
+    if state == 'R' or state == 'E':
+        return 'running'
+    if state == 'H' or state == 'T':
+        return 'pending'
+    if state == 'C':
+        return 'done'
+    return 'unknown'
+
+
+MONTHS = { 'Jan' : 1, 'Feb' : 2, 'Mar' : 3, 'Apr' : 4, 'May' : 5, 'Jun' : 6,
+           'Jul' : 7, 'Aug' : 8, 'Sep' : 9, 'Oct' : 10, 'Nov' : 11, 'Dec' : 12 }
+
+class TimestampConverter:
+
+    #
+    # Converts the ctime strings printed by qstat ("Wed Aug 21 11:37:25 2013",
+    # local time of the server) into timestamps. Any timestamp MUST refer
+    # to UTC: mktime already returns seconds since the epoch, daylight
+    # saving time included (tm_isdst = -1), and the UTC "now" is time.time().
+    #
+    def __init__(self, maxSize=65536):
+        self.maxSize = maxSize
+        self.cache = dict()
+        self.tick = 0
+        self.misses = 0
+
+    def _parse(self, tStr):
+        tmpl = tStr.split()
+        if len(tmpl) == 5 and tmpl[1] in MONTHS:
+            hms = tmpl[3].split(':')
+            if len(hms) == 3:
+                return (int(tmpl[4]), MONTHS[tmpl[1]], int(tmpl[2]),
+                        int(hms[0]), int(hms[1]), int(hms[2]), 0, 0, -1)
+        #
+        # non-standard layout (e.g. different locale)
+        #
+        return time.strptime(tStr, "%c")
+
+    def _evict(self):
+        #
+        # drop the least recently used half of the cache
+        #
+        items = self.cache.items()
+        items.sort(key=lambda item: item[1][1])
+        for key, value in items[:len(items) / 2 + 1]:
+            del self.cache[key]
+
+    def convert(self, tStr):
+        self.tick += 1
+        item = self.cache.get(tStr)
+        if item:
+            item[1] = self.tick
+            return item[0]
+
+        self.misses += 1
+        result = int(time.mktime(self._parse(tStr)))
+
+        if len(self.cache) >= self.maxSize:
+            self._evict()
+        self.cache[tStr] = [result, self.tick]
+        return result
+
+
+DEFAULT_GROUP_TTL = 86400
+
+class GroupResolver:
+
+    #
+    # Maps a user name to the name of its primary group.
+    # Every account is looked up in NSS at most once per instance,
+    # unknown users included (cached as None).
+    # With a cache file the table is shared among runs, entries older
+    # than ttl seconds are discarded on load.
+    #
+    def __init__(self, cacheFile=None, ttl=DEFAULT_GROUP_TTL, preload=False):
+        self.cacheFile = cacheFile
+        self.ttl = ttl
+        self.table = dict()
+        self.stamps = dict()
+        self.modified = False
+        self.lookups = 0
+        
+        if cacheFile:
+            self.load()
+        if preload:
+            self.preload()
+
+    def load(self):
+        cFile = None
+        now = int(time.time())
+        try:
+            try:
+                cFile = open(self.cacheFile)
+                for line in cFile:
+                    tmpl = line.rstrip('\n').split('\t')
+                    if len(tmpl) <> 3 or now - int(tmpl[2]) > self.ttl:
+                        continue
+                    if tmpl[1]:
+                        self.table[tmpl[0]] = tmpl[1]
+                    else:
+                        self.table[tmpl[0]] = None
+                    self.stamps[tmpl[0]] = int(tmpl[2])
+            except:
+                logger.debug("Cannot read group cache %s" % self.cacheFile, exc_info=True)
+        finally:
+            if cFile:
+                cFile.close()
+
+    def save(self):
+        if not self.cacheFile or not self.modified:
+            return
+        
+        def writeTable(cFile):
+            for user, group in self.table.items():
+                cFile.write('%s\t%s\t%d\n' % (user, group or '', self.stamps[user]))
+        
+        try:
+            CommonUtils.writeAtomically(self.cacheFile, writeTable, 'groups')
+            self.modified = False
+        except:
+            logger.debug("Cannot write group cache %s" % self.cacheFile, exc_info=True)
+
+    def preload(self):
+        #
+        # One sweep over the group and passwd databases;
+        # accounts not enumerated by NSS are still resolved on demand
+        #
+        now = int(time.time())
+        try:
+            gidTable = dict()
+            for grEntry in grp.getgrall():
+                gidTable[grEntry[2]] = grEntry[0]
+            for pwEntry in pwd.getpwall():
+                if pwEntry[3] in gidTable and not pwEntry[0] in self.table:
+                    self.table[pwEntry[0]] = gidTable[pwEntry[3]]
+                    self.stamps[pwEntry[0]] = now
+                    self.modified = True
+        except:
+            logger.debug("Cannot preload user groups", exc_info=True)
+
+    def resolve(self, user):
+        if user in self.table:
+            return self.table[user]
+        
+        self.lookups += 1
+        group = None
+        try:
+            thisgroup=pwd.getpwnam(user)[3]
+            group = grp.getgrgid(thisgroup)[0]
+        except:
+            logger.debug("Error parsing job info output", exc_info=True)
+        
+        self.table[user] = group
+        self.stamps[user] = int(time.time())
+        self.modified = True
+        return group
+
+
+class JobRecord(object):
+
+    #
+    # Compact replacement for the job dictionary, the fields that are
+    # not set behave as missing keys.
+    # Values of the low-cardinality fields are interned and shared among jobs.
+    #
+    __slots__ = ('jobid', 'name', 'user', 'group', 'state', 'queue', 'qtime',
+                 'start', 'startAnchor', 'walltime', 'maxwalltime', 'cpucount')
+
+    interned = frozenset(['user', 'group', 'state', 'queue', 'startAnchor'])
+
+    #
+    # only the slots are keys, methods and class attributes are not
+    #
+    fields = frozenset(__slots__)
+
+    def __getitem__(self, key):
+        if not key in JobRecord.fields:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if not key in JobRecord.fields:
+            raise KeyError(key)
+        if key in JobRecord.interned:
+            value = intern(value)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if not key in JobRecord.fields:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in JobRecord.fields and hasattr(self, key)
+
+    has_key = __contains__
+
+    def get(self, key, default=None):
+        if not key in JobRecord.fields:
+            return default
+        return getattr(self, key, default)
+
+    def keys(self):
+        return [ key for key in JobRecord.__slots__ if hasattr(self, key) ]
+
+    def values(self):
+        return [ getattr(self, key) for key in self.keys() ]
+
+    def items(self):
+        return [ (key, getattr(self, key)) for key in self.keys() ]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def asDict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, JobRecord):
+            other = other.asDict()
+        return self.asDict() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return repr(self.asDict())
+
+    __str__ = __repr__
+
+
 class PBSJobHandler(Thread):
 
-    def __init__(self, container):
+    def __init__(self, container, timeConverter=None, groupResolver=None, compact=False):
         Thread.__init__(self)
         self.container = container
         self.errList = list()
-        self.jRegex = re.compile('^\s*Job Id:(.+)$')
-        self.pRegex = re.compile('^\s*([^=\s]+)\s*=(.+)$')
+        if compact:
+            self.recordClass = JobRecord
+        else:
+            self.recordClass = dict
+        if timeConverter:
+            self.timeConverter = timeConverter
+        else:
+            self.timeConverter = TimestampConverter()
+        if groupResolver:
+            self.groupResolver = groupResolver
+        else:
+            self.groupResolver = GroupResolver()
 
     def setStream(self, stream):
         self.stream = stream
 
     def _convertState(self, state):
-        if state == 'Q' or state == 'W':
-            return 'queued'
-        if state == 'R' or state == 'E':
-            return 'running'
-        if state == 'H' or state == 'T':
-            return 'pending'
-        if state == 'C':
-            return 'done'
-        return 'unknown'
+        return convertState(state)
     
     def _convertTimeStr(self, tStr):
-        #
-        # TODO verify conversion to UTC
-        #      any timestamp MUST refer to UTC
-        #
-        timetuple = time.strptime(tStr,"%c")
-        return  int(time.mktime(timetuple)) + time.timezone
-    
+        return self.timeConverter.convert(tStr)
+
     
     def _registerJobItem(self, jTable, now):
         if jTable == None:
             return
-                    
+        
+        self._completeJobItem(jTable, now)
+        self.container.append(jTable)
+        
+    def _completeJobItem(self, jTable, now):
         if not 'user' in jTable:
             self.errList.append("Cannot find user for " + jTable['jobid'])
             
@@ -81,112 +327,377 @@ class PBSJobHandler(Thread):
             if 'start' in jTable:
                 jTable['walltime'] = now - jTable['start']
                         
-        self.container.append(jTable)
-        
     
+    def _setUser(self, jTable, value):
+        jTable['user'] = value
+
+    def _setGroup(self, jTable, value):
+        jTable['group'] = value
+
+    def _setOwner(self, jTable, value):
+        tmpt = value.split('@')
+        if len(tmpt) == 2:
+            jTable['user'] = tmpt[0]
+            group = self.groupResolver.resolve(tmpt[0])
+            if group:
+                jTable['group'] = group
+
+    def _setState(self, jTable, value):
+        jTable['state'] = self._convertState(value)
+
+    def _setQueue(self, jTable, value):
+        jTable['queue'] = value
+
+    def _setQTime(self, jTable, value):
+        jTable['qtime'] = self._convertTimeStr(value)
+
+    def _setMaxWallTime(self, jTable, value):
+        tmpt = value.split(':')
+        if len(tmpt) == 3:
+            jTable['maxwalltime'] = int(tmpt[0]) * 3600 + int(tmpt[1]) * 60 + int(tmpt[2])
+
+    def _setStartTime(self, jTable, value):
+        jTable['start'] = self._convertTimeStr(value)
+        jTable['startAnchor'] = 'start_time'
+
+    def _setWallTime(self, jTable, value):
+        tmpt = value.split(':')
+        if len(tmpt) == 3:
+            jTable['walltime'] = int(tmpt[0]) * 3600 + int(tmpt[1]) * 60 + int(tmpt[2])
+
+    def _setName(self, jTable, value):
+        jTable['name'] = value
+
+    def _setCPUCount(self, jTable, value):
+        jTable['cpucount'] = value.count('+') + 1
+
+    def _dispatchTable(self):
+        #
+        # attributes not listed here are skipped without any conversion
+        #
+        return {
+            'euser' : self._setUser,
+            'egroup' : self._setGroup,
+            'Job_Owner' : self._setOwner,
+            'job_state' : self._setState,
+            'queue' : self._setQueue,
+            'qtime' : self._setQTime,
+            'Resource_List.walltime' : self._setMaxWallTime,
+            'start_time' : self._setStartTime,
+            'resources_used.walltime' : self._setWallTime,
+            'Job_Name' : self._setName,
+            'exec_host' : self._setCPUCount
+        }
+
     def run(self):
-        line = self.stream.readline()
+        for jTable in self.records():
+            self.container.append(jTable)
+
+    def records(self):
+        readline = self.stream.readline
+        dispatch = self._dispatchTable()
+        debugOn = logger.isEnabledFor(logging.DEBUG)
         currTable = None
-        now = int(time.time()) + time.timezone
+        now = int(time.time())
         
+        line = readline()
         while line:
-            parsed = self.pRegex.match(line)
-            if parsed and currTable <> None:
-            
-                logger.debug("(Attribute info) Detected item: %s" % line.strip())
-            
-                key = parsed.group(1)
-                value = parsed.group(2).strip()
-                
-                if key == 'euser':
-                
-                    currTable['user'] = value
-                
-                elif key == 'egroup':
-                
-                    currTable['group'] = value
-                
-                elif key == 'Job_Owner':
-                    tmpt = value.split('@')
-                    if len(tmpt) == 2:
-                        currTable['user'] = tmpt[0]
-                        try:
-                            thisgroup=pwd.getpwnam(tmpt[0])[3]
-                            currTable['group'] = grp.getgrgid(thisgroup)[0]
-                        except:
-                            logger.debug("Error parsing job info output", exc_info=True)
-                
-                elif key == 'job_state':
-                
-                    currTable['state'] = self._convertState(value)
-                
-                elif key == 'queue':
-                
-                    currTable['queue'] = value
-                
-                elif key == 'qtime':
-                
-                    currTable['qtime'] = self._convertTimeStr(value)
-                    
-                elif key == 'Resource_List.walltime':
-                    
-                    tmpt = value.split(':')
-                    if len(tmpt) == 3:
-                        currTable['maxwalltime'] = int(tmpt[0]) * 3600 + int(tmpt[1]) * 60 + int(tmpt[2])
-                
-                elif key == 'start_time':
-                
-                    currTable['start'] = self._convertTimeStr(value)
-                    currTable['startAnchor'] = 'start_time'
-                
-                elif key == 'resources_used.walltime':
-                
-                    tmpt = value.split(':')
-                    if len(tmpt) == 3:
-                        currTable['walltime'] = int(tmpt[0]) * 3600 + int(tmpt[1]) * 60 + int(tmpt[2])
-                
-                elif key == 'Job_Name':
-                
-                    currTable['name'] = value
-                
-                elif key == 'exec_host':
-                
-                    currTable['cpucount'] = value.count('+') + 1
-                
-            else:
-                parsed = self.jRegex.match(line)
-                if parsed:
-                
+        
+            key, sep, value = line.partition('=')
+            if sep and currTable <> None:
+                #
+                # attribute line: "<key> = <value>"; the value must not be empty
+                #
+                setter = dispatch.get(key.strip())
+                if setter:
+                    if value and value <> '\n':
+                        if debugOn:
+                            logger.debug("(Attribute info) Detected item: %s" % line.strip())
+                        setter(currTable, value.strip())
+                    line = readline()
+                    continue
+
+            tmps = line.lstrip()
+            if tmps.startswith('Job Id:') and tmps[7:].rstrip('\n'):
+
+                if debugOn:
                     logger.debug("(Job info) Detected item: %s" % line.strip())
+            
+                if currTable <> None:
+                    self._completeJobItem(currTable, now)
+                    yield currTable
                 
-                    self._registerJobItem(currTable, now)
-                    
-                    currTable = dict()
-                    currTable['jobid'] = parsed.group(1).strip()
-                    currTable['state'] = 'unknown'
+                currTable = self.recordClass()
+                currTable['jobid'] = tmps[7:].strip()
+                currTable['state'] = 'unknown'
             
-            line = self.stream.readline()
+            line = readline()
 
-        self._registerJobItem(currTable, now)
+        if currTable <> None:
+            self._completeJobItem(currTable, now)
+            yield currTable
 
     # end of thread
 
 
 
-def parse(resultContainer, pbsHost=None, filename=None):
+def parse(resultContainer, pbsHost=None, filename=None, groupResolver=None, compact=False):
+
+    container = PBSJobHandler(resultContainer, None, groupResolver, compact)
+
+    try:
+        if filename:
+            CommonUtils.parseFile(filename, container)
+            return
 
-    if filename:
-        cmd = shlex.split('cat ' + filename)
-    else:
         if pbsHost:
             cmd = shlex.split('qstat -f @%s' % pbsHost)
         else:
             cmd = shlex.split('qstat -f')
         
-    container = PBSJobHandler(resultContainer)
+        CommonUtils.parseStream(cmd, container)
+
+    finally:
+        container.groupResolver.save()
+
+
+def iterJobs(pbsHost=None, filename=None, groupResolver=None, compact=False):
+
+    #
+    # Yields the job tables one by one while qstat output is read;
+    # errors are raised once the stream has been consumed
+    #
+    handler = PBSJobHandler(None, None, groupResolver, compact)
+
+    try:
+        if filename:
+            records = CommonUtils.iterFile(filename, handler)
+        else:
+            if pbsHost:
+                cmd = shlex.split('qstat -f @%s' % pbsHost)
+            else:
+                cmd = shlex.split('qstat -f')
+            records = CommonUtils.iterStream(cmd, handler)
+
+        for jTable in records:
+            yield jTable
+
+    finally:
+        handler.groupResolver.save()
+
+
+
+class JobListHandler(Thread):
+
+    #
+    # Parser for the plain qstat listing:
+    # Job ID  Name  User  Time Use  S  Queue
+    # each item is the job serial and the row without the time use,
+    # which changes at every cycle for the running jobs
+    #
+    def __init__(self):
+        Thread.__init__(self)
+        self.errList = list()
+        self.jobList = list()
+
+    def setStream(self, stream):
+        self.stream = stream
+
+    def run(self):
+        inTable = False
+        
+        try:
+            line = self.stream.readline()
+            while line:
+                fields = line.split()
+                if not inTable:
+                    inTable = len(fields) > 0 and fields[0].startswith('---')
+                elif len(fields) >= 6:
+                    self.jobList.append((jobSerial(fields[0]), (fields[1], fields[2], fields[-2], fields[-1])))
+                line = self.stream.readline()
+        except:
+            logger.debug("Error parsing job list", exc_info=True)
+            self.errList.append(CommonUtils.errorMsgFromTrace())
+
+
+def jobSerial(jobid):
+    #
+    # the listing may truncate the server name, the serial number
+    # (with the array index) identifies the job
+    #
+    return jobid.split('.', 1)[0]
+
+
+def parseJobList(pbsHost=None, filename=None):
+    container = JobListHandler()
+
+    if filename:
+        CommonUtils.parseFile(filename, container)
+        return container.jobList
+
+    if pbsHost:
+        cmd = shlex.split('qstat @%s' % pbsHost)
+    else:
+        cmd = shlex.split('qstat')
+
+    logger.debug("Calling executable: " + repr(cmd))
+
     CommonUtils.parseStream(cmd, container)
+    return container.jobList
+
+
+DEFAULT_FULL_SCAN_INTERVAL = 3600
+DELTA_BATCH_SIZE = 500
 
+#
+# qstat -f prints this for a job that finished after the listing
+# and exits with a non-zero code, the other jobs are printed anyway
+#
+unknownJobRegex = re.compile('^qstat: Unknown Job Id')
+
+class DeltaCollector:
+
+    #
+    # Incremental version of parse(): the job table of the previous cycle
+    # is kept in stateFile together with its plain qstat listing; a new
+    # listing detects new and vanished jobs and the jobs whose row changed
+    # (state, queue, name or owner) and only those are read with qstat -f.
+    # For the other running jobs walltime is advanced by the elapsed time.
+    # A full scan is run when the state is missing, older than
+    # fullScanInterval or when the incremental update fails.
+    #
+    def __init__(self, stateFile, pbsHost=None, fullScanInterval=DEFAULT_FULL_SCAN_INTERVAL,
+                 groupResolver=None):
+        self.stateFile = stateFile
+        self.pbsHost = pbsHost
+        self.fullScanInterval = fullScanInterval
+        if groupResolver:
+            self.groupResolver = groupResolver
+        else:
+            self.groupResolver = GroupResolver()
+        self.fetched = 0
+
+    def _loadState(self):
+        sFile = None
+        try:
+            try:
+                sFile = CommonUtils.openPrivateFile(self.stateFile)
+                state = cPickle.load(sFile)
+                if 0 <= time.time() - state['scantime'] <= self.fullScanInterval:
+                    return state
+            except IOError:
+                pass
+            except:
+                logger.debug("Cannot read job state %s" % self.stateFile, exc_info=True)
+        finally:
+            if sFile:
+                sFile.close()
+        return None
+
+    def _saveState(self, state):
+        try:
+            CommonUtils.writeAtomically(self.stateFile,
+                                        lambda sFile: cPickle.dump(state, sFile,
+                                                                   cPickle.HIGHEST_PROTOCOL),
+                                        'jobs')
+        except:
+            logger.debug("Cannot write job state %s" % self.stateFile, exc_info=True)
+
+    def _fetch(self, serials):
+        jobList = list()
+        for idx in range(0, len(serials), DELTA_BATCH_SIZE):
+            cmd = ['qstat', '-f']
+            for serial in serials[idx:idx + DELTA_BATCH_SIZE]:
+                if self.pbsHost:
+                    cmd.append('%s@%s' % (serial, self.pbsHost))
+                else:
+                    cmd.append(serial)
+            
+            logger.debug("Calling executable: qstat -f <%d jobs>" % (len(cmd) - 2))
+            
+            container = PBSJobHandler(jobList, None, self.groupResolver)
+            try:
+                CommonUtils.parseStream(cmd, container)
+            except CommonUtils.CommandTimeout:
+                raise
+            except Exception, ex:
+                errLines = [ line for line in str(ex).splitlines() if line.strip() ]
+                if len(errLines) == 0:
+                    raise
+                for line in errLines:
+                    if not unknownJobRegex.match(line):
+                        raise
+                logger.debug("Jobs finished after the listing: %d" % len(errLines))
+        self.fetched += len(serials)
+        return jobList
 
+    def _fullScan(self):
+        jobList = list()
+        parse(jobList, self.pbsHost, None, self.groupResolver)
+        self.fetched += len(jobList)
+        return jobList
+
+    def _update(self, state):
+        now = int(time.time())
+        elapsed = now - state['now']
+        oldTable = state['jobs']
+        oldListing = state.get('listing', {})
+        
+        listing = parseJobList(self.pbsHost)
+        
+        changed = list()
+        for serial, row in listing:
+            if not serial in oldTable or oldListing.get(serial) <> row:
+                changed.append(serial)
+        
+        newTable = dict()
+        for jTable in self._fetch(changed):
+            newTable[jobSerial(jTable['jobid'])] = jTable
+        
+        jobList = list()
+        for serial, row in listing:
+            if serial in newTable:
+                jobList.append(newTable[serial])
+            elif serial in oldTable:
+                jTable = oldTable[serial]
+                if jTable['state'] == 'running' and 'walltime' in jTable:
+                    jTable['walltime'] += elapsed
+                jobList.append(jTable)
+            # else: the job finished between the listing and qstat -f
+        
+        return now, listing, jobList
+
+    def collect(self):
+        state = self._loadState()
+        jobList = None
+        
+        if state:
+            try:
+                now, listing, jobList = self._update(state)
+                scantime = state['scantime']
+            except:
+                logger.debug("Incremental update failed, running a full scan", exc_info=True)
+                jobList = None
+        
+        if jobList == None:
+            #
+            # the listing is taken before the scan: a job changed in between
+            # differs at the next cycle and is read again
+            #
+            now = int(time.time())
+            scantime = time.time()
+            listing = parseJobList(self.pbsHost)
+            jobList = self._fullScan()
+        
+        jobTable = dict()
+        for jTable in jobList:
+            jobTable[jobSerial(jTable['jobid'])] = jTable
+        self._saveState({ 'scantime' : scantime, 'now' : now, 'jobs' : jobTable,
+                          'listing' : dict(listing) })
+        self.groupResolver.save()
+        
+        logger.debug("Collected %d jobs, %d read with qstat -f" % (len(jobList), self.fetched))
+        return jobList
 
 
 class LRMSVersionHandler(Thread):
@@ -201,26 +712,36 @@ class LRMSVersionHandler(Thread):
         self.stream = stream
       
     def run(self):
+        #
+        # the attribute appears once, the rest of the output is not read
+        # (qstat -B output is a few lines long and cannot fill the pipe)
+        #
         line = self.stream.readline()
         while line:
             parsed = self.pRegex.match(line)
             if parsed:
                 self.version = parsed.group(1).strip()
                 logger.debug('Found version ' + self.version)
+                break
             line = self.stream.readline()
 
-def parseLRMSVersion(pbsHost=None, filename=None):
+def parseLRMSVersion(pbsHost=None, filename=None, serverInfo=None):
+    if serverInfo:
+        return serverInfo.version
+
+    container = LRMSVersionHandler()
+
     if filename:
-        cmd = shlex.split('cat ' + filename)
+        CommonUtils.parseFile(filename, container)
+        return container.version
+
+    if pbsHost:
+        cmd = shlex.split('qstat -B -f %s' % pbsHost)
     else:
-        if pbsHost:
-            cmd = shlex.split('qstat -B -f %s' % pbsHost)
-        else:
-            cmd = shlex.split('qstat -B -f')
+        cmd = shlex.split('qstat -B -f')
 
     logger.debug("Calling executable: " + repr(cmd))
 
-    container = LRMSVersionHandler()
     CommonUtils.parseStream(cmd, container)
     return container.version
 
@@ -273,6 +794,9 @@ class QueueInfoHandler(Thread):
         
     def setStream(self, stream):
         self.stream = stream
+
+    def __getstate__(self):
+        return CommonUtils.handlerState(self)
         
     def conv(self, strtime):
         parsed = self.cputRegex.match(strtime.strip())
@@ -301,83 +825,85 @@ class QueueInfoHandler(Thread):
     def run(self):
         line = self.stream.readline()
         while line:
-            parsed = self.pRegex.match(line)
+            self.parseLine(line)
+            line = self.stream.readline()
+        self.finalize()
 
-            logger.debug("(Queue info) Detected item: %s" % line.strip())
-                    
-            if parsed:
-                if parsed.group(1) == 'resources_max.cput':
+    def parseLine(self, line):
+        parsed = self.pRegex.match(line)
+
+        logger.debug("(Queue info) Detected item: %s" % line.strip())
                 
-                    self.maxCPUtime = self.conv(parsed.group(2))
-                    
-                elif parsed.group(1) == 'resources_default.cput':
+        if parsed:
+            if parsed.group(1) == 'resources_max.cput':
+            
+                self.maxCPUtime = self.conv(parsed.group(2))
                 
-                    self.defaultCPUtime = self.conv(parsed.group(2))
-                    
-                elif parsed.group(1) == 'resources_max.pcput':
+            elif parsed.group(1) == 'resources_default.cput':
+            
+                self.defaultCPUtime = self.conv(parsed.group(2))
                 
-                    self.maxPCPUtime = self.conv(parsed.group(2))
-                    
-                elif parsed.group(1) == 'resources_default.pcput':
+            elif parsed.group(1) == 'resources_max.pcput':
+            
+                self.maxPCPUtime = self.conv(parsed.group(2))
                 
-                    self.defaultPCPUtime = self.conv(parsed.group(2))
-                    
-                elif parsed.group(1) == 'max_queuable':
+            elif parsed.group(1) == 'resources_default.pcput':
+            
+                self.defaultPCPUtime = self.conv(parsed.group(2))
                 
-                    self.maxTotJobs = int(parsed.group(2).strip())
-                    
-                elif parsed.group(1) == 'Priority':
-                    
-                    self.policyPriority = parsed.group(2).strip()
-                    
-                elif parsed.group(1) == 'max_running':
+            elif parsed.group(1) == 'max_queuable':
+            
+                self.maxTotJobs = int(parsed.group(2).strip())
                 
-                    self.maxRunJobs = int(parsed.group(2).strip())
-                    
-                elif parsed.group(1) == 'resources_max.walltime':
+            elif parsed.group(1) == 'Priority':
                 
-                    self.maxWallTime = self.conv(parsed.group(2))
-                    
-                elif parsed.group(1) == 'resources_default.walltime':
+                self.policyPriority = parsed.group(2).strip()
                 
-                    self.defaultWallTime = self.conv(parsed.group(2))
-                    
-                elif parsed.group(1) == 'resources_max.procct':
+            elif parsed.group(1) == 'max_running':
+            
+                self.maxRunJobs = int(parsed.group(2).strip())
                 
-                    self.maxProcCount = int(parsed.group(2).strip())
-                    
-                elif parsed.group(1) == 'resources_default.procct':
+            elif parsed.group(1) == 'resources_max.walltime':
+            
+                self.maxWallTime = self.conv(parsed.group(2))
                 
-                    self.defaultProcCount = int(parsed.group(2).strip())
-                    
-                elif parsed.group(1) == 'resources_default.mem':
+            elif parsed.group(1) == 'resources_default.walltime':
+            
+                self.defaultWallTime = self.conv(parsed.group(2))
                 
-                    self.defaultMem = self.convMem(parsed.group(2))
-                    
-                elif parsed.group(1) == 'resources_default.vmem':
+            elif parsed.group(1) == 'resources_max.procct':
+            
+                self.maxProcCount = int(parsed.group(2).strip())
                 
-                    self.defaultVMem = self.convMem(parsed.group(2))
-                    
-                elif parsed.group(1) == 'resources_max.mem':
+            elif parsed.group(1) == 'resources_default.procct':
+            
+                self.defaultProcCount = int(parsed.group(2).strip())
                 
-                    self.maxMem = self.convMem(parsed.group(2))
-                    
-                elif parsed.group(1) == 'resources_max.vmem':
+            elif parsed.group(1) == 'resources_default.mem':
+            
+                self.defaultMem = self.convMem(parsed.group(2))
                 
-                    self.maxVMem = self.convMem(parsed.group(2))
-                    
-                elif parsed.group(1) == 'enabled' and parsed.group(2).strip() == 'True':
-                    
-                    self.enabled = True
-                    
-                elif parsed.group(1) == 'started' and parsed.group(2).strip() == 'True':
+            elif parsed.group(1) == 'resources_default.vmem':
+            
+                self.defaultVMem = self.convMem(parsed.group(2))
                 
-                    self.started = True
-
-
-
-            line = self.stream.readline()
+            elif parsed.group(1) == 'resources_max.mem':
+            
+                self.maxMem = self.convMem(parsed.group(2))
+                
+            elif parsed.group(1) == 'resources_max.vmem':
+            
+                self.maxVMem = self.convMem(parsed.group(2))
+                
+            elif parsed.group(1) == 'enabled' and parsed.group(2).strip() == 'True':
+                
+                self.enabled = True
+                
+            elif parsed.group(1) == 'started' and parsed.group(2).strip() == 'True':
+            
+                self.started = True
 
+    def finalize(self):
         if self.enabled:
             if self.started:
                 self.state = 'Production'
@@ -416,35 +942,191 @@ class QueueInfoHandler(Thread):
             self.maxVMem = self.defaultVMem
 
 
-def parseQueueInfo(queue, pbsHost=None, filename=None):
+class ServerInfoHandler(QueueInfoHandler):
+
+    #
+    # Server-level attributes from qstat -B -f: the version, the
+    # resource defaults and limits inherited by the queues and
+    # the job counters per state
+    #
+    def __init__(self):
+        QueueInfoHandler.__init__(self)
+        self.version = None
+        self.stateCount = dict()
+
+    def parseLine(self, line):
+        key, sep, value = line.partition('=')
+        key = key.strip()
+
+        if sep and key == 'pbs_version':
+            self.version = value.strip()
+            logger.debug('Found version ' + self.version)
+        elif sep and key == 'state_count':
+            for item in value.split():
+                state, sep, count = item.partition(':')
+                if sep:
+                    self.stateCount[state] = int(count)
+        else:
+            QueueInfoHandler.parseLine(self, line)
+
+
+def parseServerInfo(pbsHost=None, filename=None):
+    container = ServerInfoHandler()
+
     if filename:
-        cmd = shlex.split('cat ' + filename)
+        CommonUtils.parseFile(filename, container)
+        return container
+
+    if pbsHost:
+        cmd = shlex.split('qstat -B -f %s' % pbsHost)
     else:
-        if pbsHost:
-            cmd = shlex.split('qstat -Q -f %s\@%s' % (queue, pbsHost))
-        else:
-            cmd = shlex.split('qstat -Q -f %s' % queue)
+        cmd = shlex.split('qstat -B -f')
 
     logger.debug("Calling executable: " + repr(cmd))
 
+    CommonUtils.parseStream(cmd, container)
+    return container
+
+
+class SharedServerInfo:
+
+    #
+    # Runs qstat -B -f at most once, for the first thread asking
+    # for the server attributes; a failure is reported to all of them
+    #
+    def __init__(self, pbsHost=None):
+        self.pbsHost = pbsHost
+        self.lock = Lock()
+        self.serverInfo = None
+        self.error = None
+
+    def get(self):
+        self.lock.acquire()
+        try:
+            if self.serverInfo == None and self.error == None:
+                try:
+                    self.serverInfo = parseServerInfo(self.pbsHost)
+                except Exception, ex:
+                    self.error = ex
+            if self.error:
+                raise self.error
+            return self.serverInfo
+        finally:
+            self.lock.release()
+
+
+def parseQueueInfo(queue, pbsHost=None, filename=None):
     container = QueueInfoHandler()
+
+    if filename:
+        CommonUtils.parseFile(filename, container)
+        return container
+
+    if pbsHost:
+        cmd = shlex.split('qstat -Q -f %s\@%s' % (queue, pbsHost))
+    else:
+        cmd = shlex.split('qstat -Q -f %s' % queue)
+
+    logger.debug("Calling executable: " + repr(cmd))
+
     CommonUtils.parseStream(cmd, container)
     return container
 
-def parseAllQueuesInfo(queues, pbsHost=None):
+class MultiQueueInfoHandler(Thread):
+
+    def __init__(self, def_values=None, queues=None):
+        Thread.__init__(self)
+        self.errList = list()
+        self.qRegex = re.compile('^\s*Queue:(.+)$')
+        self.def_values = def_values
+        if queues <> None:
+            self.queues = set(queues)
+        else:
+            self.queues = None
+        self.handlers = dict()
+
+    def setStream(self, stream):
+        self.stream = stream
+
+    def run(self):
+        currHandler = None
+        
+        try:
+            line = self.stream.readline()
+            while line:
+                parsed = self.qRegex.match(line)
+                if parsed:
+                
+                    logger.debug("(Queue info) Detected queue: %s" % line.strip())
+                    
+                    if currHandler:
+                        currHandler.finalize()
+                    
+                    queue = parsed.group(1).strip()
+                    if self.queues == None or queue in self.queues:
+                        currHandler = QueueInfoHandler(self.def_values)
+                        self.handlers[queue] = currHandler
+                    else:
+                        currHandler = None
+                
+                elif currHandler:
+                    currHandler.parseLine(line)
+                
+                line = self.stream.readline()
+            
+            if currHandler:
+                currHandler.finalize()
+
+        except:
+            logger.debug("Error parsing queue info output", exc_info=True)
+            self.errList.append(CommonUtils.errorMsgFromTrace())
+
+
+def parseMultiQueueInfo(queues=None, pbsHost=None, filename=None, def_values=None):
+    container = MultiQueueInfoHandler(def_values, queues)
+
+    if filename:
+        CommonUtils.parseFile(filename, container)
+        return container.handlers
+
+    if pbsHost:
+        cmd = shlex.split('qstat -Q -f @%s' % pbsHost)
+    else:
+        cmd = shlex.split('qstat -Q -f')
+
+    logger.debug("Calling executable: " + repr(cmd))
+
+    CommonUtils.parseStream(cmd, container)
+    return container.handlers
+
+def parseAllQueuesInfo(queues, pbsHost=None, multiQueue=True, serverInfo=None):
     
     handlers = dict()
     
     #Reading server-level attributes
-    if pbsHost:
-        cmd = shlex.split('qstat -B -f @%s' % pbsHost)
+    if serverInfo:
+        slh = serverInfo
     else:
-        cmd = shlex.split('qstat -B -f')
-    slh = QueueInfoHandler()
-    CommonUtils.parseStream(cmd, slh)
+        slh = parseServerInfo(pbsHost)
+    
+    #
+    # without a list of queues every queue defined on the server is read
+    #
+    if queues == None:
+        return parseMultiQueueInfo(None, pbsHost, None, slh)
+    
+    if multiQueue:
+        try:
+            handlers = parseMultiQueueInfo(queues, pbsHost, None, slh)
+        except:
+            logger.debug("Cannot read all queues at once, querying each queue", exc_info=True)
+            handlers = dict()
     
     for queue in queues:
     
+        if queue in handlers:
+            continue
+    
         if pbsHost:
             cmd = shlex.split('qstat -Q -f %s\@%s' % (queue, pbsHost))
         else:
@@ -456,11 +1138,3 @@ def parseAllQueuesInfo(queues, pbsHost=None):
         CommonUtils.parseStream(cmd, handlers[queue])
     
     return handlers
-        
-
-
-
-
-
-
-
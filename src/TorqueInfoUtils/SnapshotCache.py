@@ -0,0 +1,150 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import os, os.path
+import re
+import time
+import fcntl
+import cPickle
+import logging
+
+from TorqueInfoUtils import CommonUtils
+
+logger = logging.getLogger("SnapshotCache")
+
+DEFAULT_TTL = 120
+
+class SnapshotCache:
+
+    #
+    # Parsed results shared among the tools, one file per data source
+    # and PBS host. Files are replaced by rename, so a reader always
+    # sees a complete snapshot.
+    # Without a directory the cache is disabled, as it is when the
+    # directory does not belong to the current user or can be written
+    # by others: snapshots are pickled.
+    #
+    def __init__(self, cacheDir=None, ttl=DEFAULT_TTL):
+        self.cacheDir = cacheDir
+        self.ttl = ttl
+        
+        if cacheDir and not os.path.isdir(cacheDir):
+            try:
+                os.makedirs(cacheDir, 0755)
+            except:
+                logger.debug("Cannot create %s" % cacheDir, exc_info=True)
+                self.cacheDir = None
+        
+        if self.cacheDir and not CommonUtils.isPrivatePath(self.cacheDir):
+            logger.error("Insecure snapshot directory %s, cache disabled" % cacheDir)
+            self.cacheDir = None
+
+    def _filename(self, source, pbsHost):
+        host = pbsHost or 'default'
+        return os.path.join(self.cacheDir, re.sub('[^\w.@-]', '_', '%s@%s' % (source, host)))
+
+    def get(self, source, pbsHost=None, maxAge=None):
+        if not self.cacheDir:
+            return None
+        
+        if maxAge == None:
+            maxAge = self.ttl
+        
+        sFile = None
+        try:
+            try:
+                sFile = CommonUtils.openPrivateFile(self._filename(source, pbsHost))
+                timestamp, data = cPickle.load(sFile)
+                if 0 <= time.time() - timestamp <= maxAge:
+                    logger.debug("Using snapshot for %s (%s)" % (source, pbsHost))
+                    return data
+            except IOError:
+                pass
+            except:
+                logger.debug("Cannot read snapshot for %s" % source, exc_info=True)
+        finally:
+            if sFile:
+                sFile.close()
+        
+        return None
+
+    def put(self, source, data, pbsHost=None):
+        if not self.cacheDir:
+            return
+        
+        try:
+            CommonUtils.writeAtomically(self._filename(source, pbsHost),
+                                        lambda sFile: cPickle.dump((time.time(), data), sFile,
+                                                                   cPickle.HIGHEST_PROTOCOL),
+                                        '.snapshot', 0644)
+        except:
+            logger.debug("Cannot write snapshot for %s" % source, exc_info=True)
+
+    def fetch(self, source, pbsHost, collector, *args):
+        data = self.get(source, pbsHost)
+        if data == None:
+            data = collector(*args)
+            self.put(source, data, pbsHost)
+        return data
+
+
+class LastGoodStore:
+
+    #
+    # The last successful collection of info-dynamic-pbs, with its
+    # creation time, published when a new collection fails and for at
+    # most maxStaleness seconds. Without a directory or a positive
+    # maxStaleness the store is disabled.
+    #
+    def __init__(self, cacheDir=None, maxStaleness=0, pbsHost=None):
+        if maxStaleness > 0:
+            self.snapshots = SnapshotCache(cacheDir)
+        else:
+            self.snapshots = SnapshotCache()
+        self.maxStaleness = maxStaleness
+        self.pbsHost = pbsHost
+
+    def enabled(self):
+        return self.snapshots.cacheDir <> None
+
+    def save(self, now, lrmsVer, cpuInfoHandler, qInfoHandlers):
+        self.snapshots.put('last-good', (now, lrmsVer, cpuInfoHandler, qInfoHandlers), self.pbsHost)
+
+    def load(self, queues):
+        #
+        # a collection without some of the published queues is useless
+        #
+        lastGood = self.snapshots.get('last-good', self.pbsHost, self.maxStaleness)
+        if lastGood == None or not set(queues).issubset(lastGood[3]):
+            return None
+        return lastGood
+
+    def lockRefresh(self):
+        #
+        # one refresh at a time: returns the locked file, to be closed
+        # at the end of the refresh, or None if the lock is taken
+        #
+        if not self.enabled():
+            return None
+        
+        lockFile = open(os.path.join(self.snapshots.cacheDir, '.last-good.lock'), 'w')
+        try:
+            fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            lockFile.close()
+            return None
+        return lockFile
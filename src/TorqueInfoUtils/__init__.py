@@ -18,6 +18,11 @@ __all__ = [ "QStatHandler",
             "PBSNodesHandler",
             "MAUIHandler",
             "NvidiaSMIHandler",
+            "JobFormat",
+            "SnapshotCache",
+            "CollectorDaemon",
+            "GlueRenderer",
+            "JobTable",
             "CommonUtils"]
 
 
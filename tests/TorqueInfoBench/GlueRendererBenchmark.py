@@ -0,0 +1,265 @@
+#!/usr/bin/python
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+#
+# Rendering time of the LDIF output for many share DNs,
+# one write per attribute against the GlueRenderer templates
+# usage: GlueRendererBenchmark.py [<number of DNs>] [<number of queues>]
+#
+
+import sys
+import time
+import tempfile
+
+from TorqueInfoUtils import QStatHandler
+from TorqueInfoUtils import GlueRenderer
+from TorqueInfoUtils.QStatHandler import RES_UNDEF
+from TorqueInfoUtils.GlueRenderer import MAX_INT32, MAX_UINT32, MAX_UINT64
+
+
+class FakeCPUInfo:
+
+    def __init__(self):
+        self.totalCPU = 1024
+        self.freeCPU = 128
+
+
+def legacyRender(out, qInfoHandlers, lrmsVer, cpuInfoHandler, now, interfaceOff,
+                 enableGlue21, freeGPUSlots, usedGPUSlots,
+                 glue1QueueTable, glue2QueueTable, managerTable):
+
+    if glue1QueueTable:
+
+        for glue1DN in glue1QueueTable:
+        
+            queue = glue1QueueTable[glue1DN]
+            qInfo = qInfoHandlers[queue]
+            
+            out.write(glue1DN + '\n')
+            out.write('GlueCEInfoLRMSVersion: %s\n' % lrmsVer)
+            
+            out.write('GlueCEInfoTotalCPUs: %d\n' % cpuInfoHandler.totalCPU)
+            out.write('GlueCEPolicyAssignedJobSlots: %d\n' % cpuInfoHandler.totalCPU)
+            out.write('GlueCEStateFreeCPUs: %d\n' % cpuInfoHandler.freeCPU)
+            
+            if qInfo.defaultCPUtime <> RES_UNDEF:
+                out.write('GlueCEPolicyMaxCPUTime: %d\n' % (qInfo.defaultCPUtime / 60))
+            else:
+                out.write('GlueCEPolicyMaxCPUTime: %d\n' % MAX_INT32)
+
+            if qInfo.maxCPUtime <> RES_UNDEF:
+                out.write('GlueCEPolicyMaxObtainableCPUTime: %d\n' % (qInfo.maxCPUtime / 60))
+            else:
+                out.write('GlueCEPolicyMaxObtainableCPUTime: %d\n' % MAX_INT32)
+                
+            if qInfo.maxTotJobs <> RES_UNDEF:
+                out.write('GlueCEPolicyMaxTotalJobs: %d\n' % qInfo.maxTotJobs)
+            else:
+                out.write('GlueCEPolicyMaxTotalJobs: %d\n' % MAX_INT32)
+                
+            if qInfo.policyPriority:
+                out.write('GlueCEPolicyPriority: %s\n' % qInfo.policyPriority)
+            else:
+                out.write('GlueCEPolicyPriority: %s\n' % MAX_INT32)
+                
+            if qInfo.maxRunJobs <> RES_UNDEF:
+                out.write('GlueCEPolicyMaxRunningJobs: %d\n' % qInfo.maxRunJobs)
+            else:
+                out.write('GlueCEPolicyMaxRunningJobs: %d\n' % MAX_INT32)
+                
+            if qInfo.maxTotJobs <> RES_UNDEF and qInfo.maxRunJobs <> RES_UNDEF:
+                out.write('GlueCEPolicyMaxWaitingJobs: %d\n' % (qInfo.maxTotJobs - qInfo.maxRunJobs))
+            else:
+                out.write('GlueCEPolicyMaxWaitingJobs: %d\n' % MAX_INT32)
+                
+            if qInfo.defaultWallTime <> RES_UNDEF:
+                out.write('GlueCEPolicyMaxWallClockTime: %d\n' % (qInfo.defaultWallTime / 60))
+            else:
+                out.write('GlueCEPolicyMaxWallClockTime: %d\n' % MAX_INT32)
+                
+            if qInfo.maxWallTime <> RES_UNDEF:
+                out.write('GlueCEPolicyMaxObtainableWallClockTime: %d\n' % (qInfo.maxWallTime / 60))
+            else:
+                out.write('GlueCEPolicyMaxObtainableWallClockTime: %d\n' % MAX_INT32)
+                
+            if qInfo.maxProcCount <> RES_UNDEF:
+                out.write('GlueCEPolicyMaxSlotsPerJob: %d\n' % qInfo.maxProcCount)
+            else:
+                out.write('GlueCEPolicyMaxSlotsPerJob: %d\n' % MAX_INT32)
+ 
+            if interfaceOff:
+                out.write('GlueCEStateStatus: Draining\n')
+            else:
+                out.write('GlueCEStateStatus: %s\n' % qInfo.state)
+                
+            out.write('\n')
+
+
+    if managerTable <> None:
+
+        for managerDN in managerTable:
+        
+            out.write(managerDN + '\n')
+            out.write('GLUE2ManagerProductVersion: %s\n' % lrmsVer)
+            out.write('GLUE2EntityCreationTime: %s\n' % now)
+            out.write('GLUE2ComputingManagerTotalAcceleratorSlots: GPU:%d\n' % (freeGPUSlots + usedGPUSlots))
+            out.write('GLUE2ComputingManagerUsedAcceleratorSlots: GPU:%d\n' % usedGPUSlots)
+            out.write('\n')
+            
+        for glue2DN in glue2QueueTable:
+            queue = glue2QueueTable[glue2DN]
+            qInfo = qInfoHandlers[queue]
+            
+            out.write(glue2DN + '\n')
+            if qInfo.defaultCPUtime <> RES_UNDEF:
+                out.write('GLUE2ComputingShareDefaultCPUTime: %d\n' % qInfo.defaultCPUtime)
+            else:
+                out.write('GLUE2ComputingShareDefaultCPUTime: %d\n' % MAX_UINT64)
+                
+            if qInfo.maxCPUtime <> RES_UNDEF:
+                out.write('GLUE2ComputingShareMaxCPUTime: %d\n' % qInfo.maxCPUtime)
+            else:
+                out.write('GLUE2ComputingShareMaxCPUTime: %d\n' % MAX_UINT64)
+                
+            if qInfo.defaultWallTime <> RES_UNDEF:
+                out.write('GLUE2ComputingShareDefaultWallTime: %d\n' % qInfo.defaultWallTime)
+            else:
+                out.write('GLUE2ComputingShareDefaultWallTime: %d\n' % MAX_UINT64)
+                
+            if qInfo.maxWallTime <> RES_UNDEF:
+                out.write('GLUE2ComputingShareMaxWallTime: %d\n' % qInfo.maxWallTime)
+            else:
+                out.write('GLUE2ComputingShareMaxWallTime: %d\n' % MAX_UINT64)
+                
+            if qInfo.maxProcCount <> RES_UNDEF:
+                out.write('GLUE2ComputingShareMaxSlotsPerJob: %d\n' % qInfo.maxProcCount)
+            else:
+                out.write('GLUE2ComputingShareMaxSlotsPerJob: %d\n' % MAX_UINT32)
+                
+            # take maxjobs into consideration for max-running and max-waiting as well
+            if qInfo.maxTotJobs <> RES_UNDEF:
+                maxjobs = qInfo.maxTotJobs
+            else:
+                maxjobs = MAX_UINT32
+
+            if qInfo.maxRunJobs <> RES_UNDEF:
+                out.write('GLUE2ComputingShareMaxRunningJobs: %d\n' % qInfo.maxRunJobs)
+            else:
+                out.write('GLUE2ComputingShareMaxRunningJobs: %d\n' % maxjobs)
+            
+            #
+            # TODO get info per vo (vomaxjobs-*)
+            #      for the moment queue-wide values are used
+            #    
+            out.write('GLUE2ComputingShareMaxTotalJobs: %d\n' % maxjobs)
+                
+            if qInfo.maxTotJobs <> RES_UNDEF and qInfo.maxRunJobs <> RES_UNDEF:
+                out.write('GLUE2ComputingShareMaxWaitingJobs: %d\n' % (qInfo.maxTotJobs - qInfo.maxRunJobs))
+            else:
+                out.write('GLUE2ComputingShareMaxWaitingJobs: %d\n' % maxjobs)
+                
+            if qInfo.maxMem <> RES_UNDEF:
+                out.write('GLUE2ComputingShareMaxMainMemory: %d\n' % qInfo.maxMem)
+            else:
+                out.write('GLUE2ComputingShareMaxMainMemory: %d\n' % MAX_UINT64)
+                
+            if qInfo.maxVMem <> RES_UNDEF:
+                out.write('GLUE2ComputingShareMaxVirtualMemory: %d\n' % qInfo.maxVMem)
+            else:
+                out.write('GLUE2ComputingShareMaxVirtualMemory: %d\n' % MAX_UINT64)
+            
+            if interfaceOff:
+                out.write('GLUE2ComputingShareServingState: draining\n')
+            else:
+                out.write('GLUE2ComputingShareServingState: %s\n' % qInfo.state.lower())
+                
+            out.write('GLUE2EntityCreationTime: %s\n' % now)
+            
+            if enableGlue21:
+
+                out.write('GLUE2ComputingShareFreeAcceleratorSlots: GPU:%d\n' % freeGPUSlots)
+                out.write('GLUE2ComputingShareUsedAcceleratorSlots: GPU:%d\n' % usedGPUSlots)
+            
+            out.write('\n')
+
+
+def createTables(numOfDNs, numOfQueues):
+    qInfoHandlers = dict()
+    for idx in range(numOfQueues):
+        qInfo = QStatHandler.QueueInfoHandler()
+        qInfo.maxCPUtime = 86400
+        qInfo.maxWallTime = 129600 + idx
+        qInfo.maxRunJobs = 100
+        if idx % 2:
+            qInfo.maxTotJobs = 200
+            qInfo.policyPriority = '10'
+        qInfo.enabled = True
+        qInfo.started = True
+        qInfo.finalize()
+        qInfoHandlers['queue%d' % idx] = qInfo
+
+    glue1QueueTable = dict()
+    glue2QueueTable = dict()
+    for idx in range(numOfDNs):
+        queue = 'queue%d' % (idx % numOfQueues)
+        glue1QueueTable['dn: GlueCEUniqueID=ce.pd.infn.it:8443/cream-pbs-%s-%d,mds-vo-name=resource,o=grid' % (queue, idx)] = queue
+        glue2QueueTable['dn: GLUE2ShareID=%s_vo%d_ce.pd.infn.it_ComputingElement,GLUE2ServiceID=ce.pd.infn.it_ComputingElement,GLUE2GroupID=resource,o=glue' % (queue, idx)] = queue
+    managerTable = { 'dn: GLUE2ManagerId=ce.pd.infn.it_ComputingElement_Manager,GLUE2ServiceID=ce.pd.infn.it_ComputingElement,GLUE2GroupID=resource,o=glue' : 'ce.pd.infn.it_ComputingElement_Manager' }
+    return qInfoHandlers, glue1QueueTable, glue2QueueTable, managerTable
+
+
+def timeRender(function, *args):
+    out = tempfile.TemporaryFile()
+    try:
+        startTime = time.time()
+        function(out, *args)
+        out.flush()
+        elapsed = time.time() - startTime
+        out.seek(0)
+        return elapsed, out.read()
+    finally:
+        out.close()
+
+
+def main():
+    numOfDNs = 5000
+    numOfQueues = 10
+    if len(sys.argv) > 1:
+        numOfDNs = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        numOfQueues = int(sys.argv[2])
+
+    qInfoHandlers, glue1QueueTable, glue2QueueTable, managerTable = createTables(numOfDNs, numOfQueues)
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    
+    legacyTime, legacyOut = timeRender(legacyRender, qInfoHandlers, '2.5.7', FakeCPUInfo(), now, False,
+                                       True, 4, 2, glue1QueueTable, glue2QueueTable, managerTable)
+    
+    def currRender(out):
+        renderer = GlueRenderer.GlueRenderer(qInfoHandlers, '2.5.7', FakeCPUInfo(), now, False, True, 4, 2)
+        renderer.render(out, glue1QueueTable, glue2QueueTable, managerTable)
+    currTime, currOut = timeRender(currRender)
+
+    sys.stdout.write("DNs:      %d (x2), %d queues\n" % (numOfDNs, numOfQueues))
+    sys.stdout.write("legacy:   %.3fs\n" % legacyTime)
+    sys.stdout.write("current:  %.3fs\n" % currTime)
+    sys.stdout.write("speedup:  %.2fx\n" % (legacyTime / currTime))
+    sys.stdout.write("same output: %s\n" % (legacyOut == currOut))
+
+
+if __name__ == "__main__":
+    main()
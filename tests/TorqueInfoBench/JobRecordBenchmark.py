@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+#
+# Peak memory of the job list built by QStatHandler.parse,
+# plain dictionaries against compact JobRecord objects
+# usage: JobRecordBenchmark.py [<number of jobs>]
+#
+
+import sys
+import os, os.path
+import resource
+import subprocess
+
+from TorqueInfoUtils import QStatHandler
+from QStatBenchmark import createDump
+
+
+def measure(filename, compact):
+    outList = list()
+    QStatHandler.parse(outList, None, filename, None, compact)
+    # peak resident set size in kilobytes
+    sys.stdout.write("%d %d\n" % (len(outList), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def runChild(filename, mode):
+    #
+    # every measure runs in a fresh interpreter
+    #
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', filename, mode]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    numOfJobs, peakRSS = output.split()
+    return int(numOfJobs), int(peakRSS)
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        measure(sys.argv[2], sys.argv[3] == 'compact')
+        return
+
+    numOfJobs = 100000
+    if len(sys.argv) > 1:
+        numOfJobs = int(sys.argv[1])
+
+    filename = createDump(numOfJobs)
+    try:
+        dictJobs, dictRSS = runChild(filename, 'dict')
+        compJobs, compRSS = runChild(filename, 'compact')
+    finally:
+        os.remove(filename)
+
+    sys.stdout.write("jobs:      %d\n" % numOfJobs)
+    sys.stdout.write("dict:      %d kB peak RSS\n" % dictRSS)
+    sys.stdout.write("compact:   %d kB peak RSS\n" % compRSS)
+    sys.stdout.write("reduction: %.1f%%\n" % (100.0 * (dictRSS - compRSS) / dictRSS))
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+#
+# Throughput benchmark for the qstat -f job parser
+# usage: QStatBenchmark.py [<number of jobs>]
+#
+
+import sys
+import os, os.path
+import re
+import time
+import pwd
+import grp
+import tempfile
+import logging
+
+from TorqueInfoUtils import CommonUtils
+from TorqueInfoUtils import QStatHandler
+
+logger = logging.getLogger("QStatBenchmark")
+
+jobPattern = '''Job Id: %(jserial)d.cert-34.pd.infn.it
+    Job_Name = cream_%(jserial)d
+    Job_Owner = dteam%(user)03d@cert-34.pd.infn.it
+    resources_used.cput = 00:10:12
+    resources_used.mem = 254136kb
+    resources_used.vmem = 1212440kb
+    resources_used.walltime = 01:%(minutes)02d:12
+    job_state = %(jstate)s
+    queue = %(queue)s
+    server = cert-34.pd.infn.it
+    Checkpoint = u
+    ctime = Wed Aug 21 11:37:25 2013
+    Error_Path = cert-34.pd.infn.it:/dev/null
+    exec_host = wn-%(jserial)d.pd.infn.it/0+wn-%(jserial)d.pd.infn.it/1
+    Hold_Types = n
+    Join_Path = n
+    Keep_Files = n
+    Mail_Points = n
+    mtime = Wed Aug 21 11:37:25 2013
+    Output_Path = cert-34.pd.infn.it:/dev/null
+    Priority = 0
+    qtime = Wed Aug 21 11:%(minutes)02d:25 2013
+    Rerunable = True
+    Resource_List.neednodes = 1
+    Resource_List.nodect = 1
+    Resource_List.nodes = 1
+    Resource_List.walltime = 36:00:00
+    session_id = 12345
+    Shell_Path_List = /bin/bash
+    euser = dteam%(user)03d
+    egroup = dteam
+    substate = 42
+    Variable_List = PBS_O_QUEUE=cert,PBS_O_HOME=/home/dteam013,
+	PBS_O_LANG=en_US.UTF-8,PBS_O_LOGNAME=dteam013,
+	PBS_O_PATH=/usr/kerberos/bin:/bin:/usr/bin:/home/dteam013/bin,
+	PBS_O_WORKDIR=/var/tmp
+    queue_rank = 23
+    queue_type = E
+    etime = Wed Aug 21 11:37:25 2013
+    submit_args = /tmp/cream_%(jserial)d
+    start_time = Wed Aug 21 11:%(minutes)02d:26 2013
+    start_count = 1
+    fault_tolerant = False
+    submit_host = cert-34.pd.infn.it
+    init_work_dir = /var/tmp
+
+'''
+
+
+class LegacyPBSJobHandler(QStatHandler.PBSJobHandler):
+
+    #
+    # regex and if/elif based parser with strptime, as in release 2.4.6
+    #
+    def __init__(self, container):
+        QStatHandler.PBSJobHandler.__init__(self, container)
+        self.jRegex = re.compile('^\s*Job Id:(.+)$')
+        self.pRegex = re.compile('^\s*([^=\s]+)\s*=(.+)$')
+
+    def _convertTimeStr(self, tStr):
+        timetuple = time.strptime(tStr,"%c")
+        return  int(time.mktime(timetuple)) + time.timezone
+
+    def run(self):
+        line = self.stream.readline()
+        currTable = None
+        now = int(time.time()) + time.timezone
+        
+        while line:
+            parsed = self.pRegex.match(line)
+            if parsed and currTable <> None:
+            
+                logger.debug("(Attribute info) Detected item: %s" % line.strip())
+            
+                key = parsed.group(1)
+                value = parsed.group(2).strip()
+                
+                if key == 'euser':
+                    currTable['user'] = value
+                elif key == 'egroup':
+                    currTable['group'] = value
+                elif key == 'Job_Owner':
+                    tmpt = value.split('@')
+                    if len(tmpt) == 2:
+                        currTable['user'] = tmpt[0]
+                        try:
+                            thisgroup=pwd.getpwnam(tmpt[0])[3]
+                            currTable['group'] = grp.getgrgid(thisgroup)[0]
+                        except:
+                            logger.debug("Error parsing job info output", exc_info=True)
+                elif key == 'job_state':
+                    currTable['state'] = self._convertState(value)
+                elif key == 'queue':
+                    currTable['queue'] = value
+                elif key == 'qtime':
+                    currTable['qtime'] = self._convertTimeStr(value)
+                elif key == 'Resource_List.walltime':
+                    tmpt = value.split(':')
+                    if len(tmpt) == 3:
+                        currTable['maxwalltime'] = int(tmpt[0]) * 3600 + int(tmpt[1]) * 60 + int(tmpt[2])
+                elif key == 'start_time':
+                    currTable['start'] = self._convertTimeStr(value)
+                    currTable['startAnchor'] = 'start_time'
+                elif key == 'resources_used.walltime':
+                    tmpt = value.split(':')
+                    if len(tmpt) == 3:
+                        currTable['walltime'] = int(tmpt[0]) * 3600 + int(tmpt[1]) * 60 + int(tmpt[2])
+                elif key == 'Job_Name':
+                    currTable['name'] = value
+                elif key == 'exec_host':
+                    currTable['cpucount'] = value.count('+') + 1
+                
+            else:
+                parsed = self.jRegex.match(line)
+                if parsed:
+                
+                    logger.debug("(Job info) Detected item: %s" % line.strip())
+                
+                    self._registerJobItem(currTable, now)
+                    
+                    currTable = dict()
+                    currTable['jobid'] = parsed.group(1).strip()
+                    currTable['state'] = 'unknown'
+            
+            line = self.stream.readline()
+
+        self._registerJobItem(currTable, now)
+
+
+def createDump(numOfJobs):
+    tmpfd, tmpfilename = tempfile.mkstemp(".txt", "qstat")
+    dataFile = os.fdopen(tmpfd, 'w')
+    for idx in range(numOfJobs):
+        dataFile.write(jobPattern % { 'jserial' : idx,
+                                      'user' : idx % 300,
+                                      'minutes' : idx % 60,
+                                      'jstate' : 'QRHE'[idx % 4],
+                                      'queue' : ('cert', 'long', 'short')[idx % 3] })
+    dataFile.close()
+    return tmpfilename
+
+
+def timeParser(handlerClass, filename):
+    outList = list()
+    container = handlerClass(outList)
+    startTime = time.time()
+    CommonUtils.parseFile(filename, container, False)
+    return time.time() - startTime, outList
+
+
+def main():
+    numOfJobs = 20000
+    if len(sys.argv) > 1:
+        numOfJobs = int(sys.argv[1])
+
+    filename = createDump(numOfJobs)
+    try:
+        legacyTime, legacyList = timeParser(LegacyPBSJobHandler, filename)
+        currTime, currList = timeParser(QStatHandler.PBSJobHandler, filename)
+    finally:
+        os.remove(filename)
+
+    #
+    # "now" is sampled independently by each run
+    #
+    for jTable in legacyList + currList:
+        if jTable.get('startAnchor') == 'resources_used.walltime':
+            del jTable['start']
+    
+    #
+    # release 2.4.6 shifted every timestamp by time.timezone
+    #
+    for jTable in legacyList:
+        for key in ('qtime', 'start'):
+            if key in jTable:
+                jTable[key] -= time.timezone
+
+    sys.stdout.write("jobs:     %d\n" % numOfJobs)
+    sys.stdout.write("legacy:   %.3fs (%.0f jobs/s)\n" % (legacyTime, numOfJobs / legacyTime))
+    sys.stdout.write("current:  %.3fs (%.0f jobs/s)\n" % (currTime, numOfJobs / currTime))
+    sys.stdout.write("speedup:  %.2fx\n" % (legacyTime / currTime))
+    sys.stdout.write("same output: %s\n" % (legacyList == currList))
+    
+    if legacyList <> currList:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,131 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import os, os.path
+import stat
+import time
+import unittest
+from threading import Thread
+
+from TorqueInfoUtils import CollectorDaemon
+from TorqueInfoUtils import PBSNodesHandler
+from TorqueInfoUtils import QStatHandler
+from TestUtils import Workspace
+
+
+class CollectorDaemonTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = Workspace()
+        self.socketPath = os.path.join(self.workspace.workspace, 'run', 'collector.sock')
+        
+        config = { 'pbs-host' : None, 'collector-socket' : self.socketPath, 
+                   'collector-interval' : 60, 'maui-host' : None, 'maui-keyfile' : None }
+        self.pbsnodesPattern = '''cert-wn64-01.pn.pd.infn.it
+     state = free
+     np = 4
+     properties = lcgpro,gpu
+     jobs = 0/15.cert-34.pd.infn.it
+     gpu_status = gpu[0]=gpu_utilization=0%;gpu_memory_utilization=0%
+
+'''
+        self.queuePattern = '''Queue: cert
+    max_running = 10
+    enabled = True
+    started = True
+
+'''
+        
+        self.daemon = CollectorDaemon.CollectorDaemon(config)
+        # no polling, data are injected by the tests
+        self.daemon.pollers = list()
+        
+        self.srvThread = Thread(target=self.daemon.serve)
+        self.srvThread.start()
+        for idx in range(50):
+            if os.path.exists(self.socketPath):
+                break
+            time.sleep(0.1)
+
+    def tearDown(self):
+        self.daemon.stop()
+        self.srvThread.join()
+
+    def test_query_ok(self):
+        
+        self.daemon.update('lrmsver', '2.5.7')
+        self.daemon.update('qstat', [ { 'jobid' : '01.cert-34.pd.infn.it', 'state' : 'running' } ])
+        
+        result = CollectorDaemon.query('lrmsver', None, self.socketPath) == '2.5.7'
+        jobList = CollectorDaemon.query('qstat', None, self.socketPath)
+        self.assertTrue(result and jobList[0]['state'] == 'running')
+
+    def test_query_handlers(self):
+        
+        tmpfile = self.workspace.createFile(self.pbsnodesPattern)
+        self.daemon.update('pbsnodes', PBSNodesHandler.parseCPUInfo(None, tmpfile))
+        tmpfile = self.workspace.createFile(self.queuePattern)
+        self.daemon.update('queues', QStatHandler.parseMultiQueueInfo(None, None, tmpfile))
+        
+        container = CollectorDaemon.query('pbsnodes', None, self.socketPath)
+        result = container.totalCPU == 4 and container.freeCPU == 3
+        result = result and container.nodesWithProperty('gpu')[0].jobIds == ('15.cert-34.pd.infn.it',)
+        result = result and container.gpuTable['cert-wn64-01.pn.pd.infn.it']['free_gpus'] == 1
+        
+        handlers = CollectorDaemon.query('queues', None, self.socketPath)
+        result = result and handlers['cert'].maxRunJobs == 10 and handlers['cert'].state == 'Production'
+        self.assertTrue(result and type(handlers['cert'].state) == str)
+
+    def test_query_other_server(self):
+        
+        self.daemon.update('lrmsver', '2.5.7')
+        self.assertTrue(CollectorDaemon.query('lrmsver', 'cert-34.pd.infn.it', self.socketPath) == None)
+
+    def test_query_missing(self):
+        
+        self.daemon.updateError('pbsnodes', 'Connection refused')
+        result = CollectorDaemon.query('pbsnodes', None, self.socketPath) == None
+        self.assertTrue(result and CollectorDaemon.query('queues', None, self.socketPath) == None)
+
+    def test_query_stale(self):
+        
+        self.daemon.update('lrmsver', '2.5.7')
+        self.assertTrue(CollectorDaemon.query('lrmsver', None, self.socketPath, -1) == None)
+
+    def test_daemon_interval(self):
+        
+        #
+        # by default data are too old after three intervals of the daemon
+        #
+        self.daemon.interval = -1
+        self.daemon.update('lrmsver', '2.5.7')
+        self.assertTrue(CollectorDaemon.query('lrmsver', None, self.socketPath) == None)
+
+    def test_insecure_socket(self):
+        
+        self.daemon.update('lrmsver', '2.5.7')
+        result = stat.S_IMODE(os.stat(os.path.dirname(self.socketPath)).st_mode) == 0700
+        os.chmod(os.path.dirname(self.socketPath), 0777)
+        self.assertTrue(result and CollectorDaemon.query('lrmsver', None, self.socketPath) == None)
+
+    def test_no_daemon(self):
+        
+        socketPath = os.path.join(self.workspace.workspace, 'none.sock')
+        self.assertTrue(CollectorDaemon.query('lrmsver', None, socketPath) == None)
+
+if __name__ == '__main__':
+    unittest.main()
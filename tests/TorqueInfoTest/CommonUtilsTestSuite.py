@@ -0,0 +1,320 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import os, os.path
+import time
+import unittest
+from threading import Thread, Lock
+
+from TorqueInfoUtils import CommonUtils
+from TestUtils import Workspace
+
+
+class CollectionSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = Lock()
+        self.running = 0
+        self.maxRunning = 0
+
+    def _collect(self, value):
+        self.lock.acquire()
+        self.running += 1
+        self.maxRunning = max(self.maxRunning, self.running)
+        self.lock.release()
+        time.sleep(0.1)
+        self.lock.acquire()
+        self.running -= 1
+        self.lock.release()
+        return value
+
+    def _fail(self, message):
+        raise Exception(message)
+
+    def test_results_ok(self):
+        scheduler = CommonUtils.CollectionScheduler(3)
+        scheduler.add('first', self._collect, 1)
+        scheduler.add('second', self._collect, 2)
+        scheduler.add('third', self._collect, 3)
+        scheduler.start()
+        result = (scheduler.result('first'), scheduler.result('second'), scheduler.result('third'))
+        self.assertTrue(result == (1, 2, 3) and self.maxRunning > 1)
+
+    def test_concurrency_cap(self):
+        scheduler = CommonUtils.CollectionScheduler(2)
+        for idx in range(5):
+            scheduler.add('source%d' % idx, self._collect, idx)
+        scheduler.run()
+        self.assertTrue(self.maxRunning == 2)
+
+    def test_error_per_source(self):
+        scheduler = CommonUtils.CollectionScheduler(3)
+        scheduler.add('good', self._collect, 'ok')
+        scheduler.add('bad', self._fail, 'Cannot contact server')
+        scheduler.start()
+        try:
+            scheduler.result('bad')
+            self.fail("Exception not raised")
+        except Exception, ex:
+            msg = str(ex)
+            self.assertTrue(msg == 'Cannot contact server' and scheduler.result('good') == 'ok')
+
+    def test_result_timeout(self):
+        scheduler = CommonUtils.CollectionScheduler(1)
+        scheduler.add('slow', time.sleep, 2)
+        scheduler.start()
+        self.assertRaises(CommonUtils.CommandTimeout, scheduler.result, 'slow', 0.1)
+        scheduler.result('slow')
+
+    def test_time_budget(self):
+        budget = CommonUtils.TimeBudget(10, time.time() - 4)
+        timeouts = budget.bound({ 'qstat' : 30, 'pbsnodes' : 2, 'ssh' : None })
+        result = timeouts == { 'qstat' : 6, 'pbsnodes' : 2, 'ssh' : 6 } and not budget.expired()
+        
+        budget = CommonUtils.TimeBudget(None)
+        result = result and budget.remaining() == None and budget.bound({ 'qstat' : None }) == { 'qstat' : None }
+        self.assertTrue(result and CommonUtils.TimeBudget(1, time.time() - 2).expired())
+
+
+
+class StatusProbeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = Workspace()
+
+    def test_probe_off(self):
+        probe = self.workspace.createExecutable('probe', '#!/bin/sh\nexit 2\n')
+        self.assertTrue(CommonUtils.interfaceIsOff({ 'status-probe' : probe }))
+
+    def test_probe_on(self):
+        probe = self.workspace.createExecutable('probe', '#!/bin/sh\nexit 0\n')
+        self.assertFalse(CommonUtils.interfaceIsOff({ 'status-probe' : probe }))
+
+    def test_probe_timeout(self):
+        probe = self.workspace.createExecutable('probe', '#!/bin/sh\nexec sleep 10\n')
+        startTime = time.time()
+        result = CommonUtils.interfaceIsOff({ 'status-probe' : probe, 'status-probe-timeout' : 1 })
+        self.assertTrue(not result and time.time() - startTime < 5)
+
+    def test_probe_timeout_children(self):
+        pidFile = os.path.join(self.workspace.workspace, 'child.pid')
+        probe = self.workspace.createExecutable('probe', '#!/bin/sh\nsleep 10 &\necho $! > %s\nwait\n' % pidFile)
+        CommonUtils.interfaceIsOff({ 'status-probe' : probe, 'status-probe-timeout' : 1 })
+        childPid = int(open(pidFile).read())
+        
+        #
+        # the orphaned child is killed, a zombie not yet reaped by init
+        # counts as dead
+        #
+        childAlive = True
+        for idx in range(20):
+            try:
+                statFile = open('/proc/%d/stat' % childPid)
+                try:
+                    childState = statFile.read().rsplit(')', 1)[1].split()[0]
+                finally:
+                    statFile.close()
+            except IOError:
+                childState = 'X'
+            if childState in ('Z', 'X'):
+                childAlive = False
+                break
+            time.sleep(0.1)
+        self.assertFalse(childAlive)
+
+
+class LineHandler(Thread):
+
+    def __init__(self):
+        Thread.__init__(self)
+        self.errList = list()
+        self.lines = list()
+
+    def setStream(self, stream):
+        self.stream = stream
+
+    def run(self):
+        line = self.stream.readline()
+        while line:
+            self.lines.append(line.strip())
+            line = self.stream.readline()
+
+
+class ParseStreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = Workspace()
+        self.script = self.workspace.createExecutable('slowcmd', '#!/bin/sh\necho first\nsleep 30\necho second\n')
+
+    def tearDown(self):
+        CommonUtils.setCommandTimeouts(dict())
+
+    def test_timeout_partial(self):
+        container = LineHandler()
+        startTime = time.time()
+        try:
+            CommonUtils.parseStream([self.script], container, 1)
+            self.fail("Exception not raised")
+        except CommonUtils.CommandTimeout, ex:
+            result = ex.container.lines == ['first'] and 'slowcmd' in str(ex)
+            self.assertTrue(result and time.time() - startTime < 5)
+
+    def test_timeout_by_command(self):
+        CommonUtils.setCommandTimeouts({ 'slowcmd' : 1, 'qstat' : None })
+        startTime = time.time()
+        self.assertRaises(CommonUtils.CommandTimeout, CommonUtils.parseStream, [self.script], LineHandler())
+        self.assertTrue(time.time() - startTime < 5)
+
+    def test_timeout_detached_child(self):
+        #
+        # a child in another session keeps the pipes open after the kill
+        #
+        script = self.workspace.createExecutable('detachcmd', '#!/bin/sh\necho first\nsetsid sleep 6 &\nsleep 30\n')
+        startTime = time.time()
+        self.assertRaises(CommonUtils.CommandTimeout, CommonUtils.parseStream, [script], LineHandler(), 1)
+        self.assertTrue(time.time() - startTime < 5)
+
+    def test_no_timeout_ok(self):
+        script = self.workspace.createExecutable('fastcmd', '#!/bin/sh\necho first\necho second\n')
+        container = LineHandler()
+        CommonUtils.parseStream([script], container, 5)
+        self.assertTrue(container.lines == ['first', 'second'])
+
+
+class LdifMapsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = Workspace()
+        self.ldifDir = os.path.join(self.workspace.workspace, 'ldif')
+        os.mkdir(self.ldifDir)
+        self.bdiiConf = self.workspace.createFile('BDII_LDIF_DIR=%s\n' % self.ldifDir)
+        self.cacheFile = os.path.join(self.workspace.workspace, 'ldif.cache')
+        
+        self.glue1Pattern = """dn: GlueCEUniqueID=cert-34.pd.infn.it:8443/cream-pbs-%(queue)s,mds-vo-name=resource,o=grid
+GlueCEName: %(queue)s
+GlueCEStateStatus: Production
+
+"""
+        self.glue2Pattern = """dn: GLUE2ShareID=%(queue)s_dteam_cert-34.pd.infn.it_ComputingElement,GLUE2ServiceID=cert-34.pd.infn.it_ComputingElement,GLUE2GroupID=resource,o=glue
+GLUE2ComputingShareMappingQueue: %(queue)s
+
+dn: GLUE2ManagerId=cert-34.pd.infn.it_ComputingElement_Manager,GLUE2ServiceID=cert-34.pd.infn.it_ComputingElement,GLUE2GroupID=resource,o=glue
+GLUE2ManagerID: cert-34.pd.infn.it_ComputingElement_Manager
+
+"""
+
+    def _writeLdif(self, name, data):
+        ldifFile = open(os.path.join(self.ldifDir, name), 'w')
+        ldifFile.write(data)
+        ldifFile.close()
+        return os.path.join(self.ldifDir, name)
+
+    def test_single_pass_ok(self):
+        self._writeLdif('static-file-CE.ldif', self.glue1Pattern % { 'queue' : 'cert' })
+        self._writeLdif('other.ldif', self.glue1Pattern % { 'queue' : 'long' } 
+                        + self.glue2Pattern % { 'queue' : 'long' })
+        
+        glue1Table, glue2Table, managerTable = CommonUtils.parseLdifMaps(self.bdiiConf)
+        
+        result = glue1Table.values() == ['cert']
+        result = result and glue2Table.values() == ['long']
+        result = result and managerTable.values() == ['cert-34.pd.infn.it_ComputingElement_Manager']
+        result = result and CommonUtils.parseLdif(self.bdiiConf, 'GLUE1') == glue1Table
+        self.assertTrue(result)
+
+    def test_cache_reused(self):
+        ldifFile = self._writeLdif('static-file-CE.ldif', self.glue1Pattern % { 'queue' : 'cert' })
+        mtime = int(time.time()) - 100
+        os.utime(ldifFile, (mtime, mtime))
+        CommonUtils.parseLdifMaps(self.bdiiConf, self.cacheFile)
+        
+        #
+        # same size and mtime: the cached tables are used
+        #
+        self._writeLdif('static-file-CE.ldif', self.glue1Pattern % { 'queue' : 'xxxx' })
+        os.utime(ldifFile, (mtime, mtime))
+        result = CommonUtils.parseLdifMaps(self.bdiiConf, self.cacheFile)[0].values() == ['cert']
+        
+        os.utime(ldifFile, (mtime + 10, mtime + 10))
+        result = result and CommonUtils.parseLdifMaps(self.bdiiConf, self.cacheFile)[0].values() == ['xxxx']
+        self.assertTrue(result)
+
+    def test_cache_new_file(self):
+        self._writeLdif('static-file-Share.ldif', self.glue2Pattern % { 'queue' : 'cert' })
+        CommonUtils.parseLdifMaps(self.bdiiConf, self.cacheFile)
+        
+        self._writeLdif('static-file-Share2.ldif', self.glue2Pattern % { 'queue' : 'long' })
+        glue2Table = CommonUtils.parseLdifMaps(self.bdiiConf, self.cacheFile)[1]
+        self.assertTrue(sorted(glue2Table.values()) == ['cert', 'long'])
+
+    def test_cache_insecure(self):
+        ldifFile = self._writeLdif('static-file-CE.ldif', self.glue1Pattern % { 'queue' : 'cert' })
+        mtime = int(time.time()) - 100
+        os.utime(ldifFile, (mtime, mtime))
+        CommonUtils.parseLdifMaps(self.bdiiConf, self.cacheFile)
+        
+        #
+        # a cache writable by others is ignored
+        #
+        os.chmod(self.cacheFile, 0666)
+        self._writeLdif('static-file-CE.ldif', self.glue1Pattern % { 'queue' : 'xxxx' })
+        os.utime(ldifFile, (mtime, mtime))
+        glue1Table = CommonUtils.parseLdifMaps(self.bdiiConf, self.cacheFile)[0]
+        self.assertTrue(glue1Table.values() == ['xxxx'])
+
+
+class WriteAtomicallyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = Workspace()
+        self.filename = os.path.join(self.workspace.workspace, 'data')
+
+    def _write(self, data):
+        def writeData(dFile):
+            dFile.write(data)
+        CommonUtils.writeAtomically(self.filename, writeData, 'data', 0644)
+
+    def test_write_ok(self):
+        self._write('first')
+        self._write('second')
+        
+        dFile = open(self.filename)
+        result = dFile.read() == 'second'
+        dFile.close()
+        result = result and os.stat(self.filename).st_mode & 0777 == 0644
+        self.assertTrue(result and os.listdir(self.workspace.workspace) == ['data'])
+
+    def test_write_error(self):
+        self._write('first')
+        
+        def failure(dFile):
+            dFile.write('partial')
+            raise IOError("No space left on device")
+        
+        self.assertRaises(IOError, CommonUtils.writeAtomically, self.filename, failure, 'data')
+        
+        #
+        # the old file is untouched and the temporary file is gone
+        #
+        dFile = open(self.filename)
+        result = dFile.read() == 'first'
+        dFile.close()
+        self.assertTrue(result and os.listdir(self.workspace.workspace) == ['data'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import unittest
+import cStringIO
+
+from TorqueInfoUtils import QStatHandler
+from TorqueInfoUtils import GlueRenderer
+
+
+class FakeCPUInfo:
+
+    def __init__(self):
+        self.totalCPU = 16
+        self.freeCPU = 4
+
+
+class GlueRendererTestCase(unittest.TestCase):
+
+    def setUp(self):
+        qInfo = QStatHandler.QueueInfoHandler()
+        qInfo.maxCPUtime = 86400
+        qInfo.maxRunJobs = 10
+        qInfo.enabled = True
+        qInfo.started = True
+        qInfo.finalize()
+        self.qInfoHandlers = { 'cert' : qInfo }
+        self.now = '2013-08-21T11:37:25Z'
+
+    def _render(self, glue1Table, glue2Table, managerTable, interfaceOff=False, enableGlue21=False):
+        renderer = GlueRenderer.GlueRenderer(self.qInfoHandlers, '2.5.7', FakeCPUInfo(), self.now,
+                                             interfaceOff, enableGlue21, 1, 2)
+        out = cStringIO.StringIO()
+        renderer.render(out, glue1Table, glue2Table, managerTable)
+        return out.getvalue().split('\n')
+
+    def test_glue1_ok(self):
+        lines = self._render({ 'dn: GlueCEUniqueID=ce1' : 'cert', 'dn: GlueCEUniqueID=ce2' : 'cert' }, None, None)
+        
+        result = lines.count('GlueCEPolicyMaxObtainableCPUTime: 1440') == 2
+        result = result and lines.count('GlueCEPolicyMaxTotalJobs: %d' % GlueRenderer.MAX_INT32) == 2
+        result = result and lines.count('GlueCEPolicyMaxWaitingJobs: %d' % GlueRenderer.MAX_INT32) == 2
+        result = result and lines.count('GlueCEStateStatus: Production') == 2
+        self.assertTrue(result and lines.count('') == 3)
+
+    def test_glue2_ok(self):
+        lines = self._render(None, { 'dn: GLUE2ShareID=share1' : 'cert' }, { 'dn: GLUE2ManagerId=man' : 'man' },
+                             True, True)
+        
+        result = lines[0] == 'dn: GLUE2ManagerId=man'
+        result = result and 'GLUE2ComputingManagerTotalAcceleratorSlots: GPU:3' in lines
+        result = result and 'GLUE2ComputingShareMaxRunningJobs: 10' in lines
+        result = result and 'GLUE2ComputingShareMaxTotalJobs: %d' % GlueRenderer.MAX_UINT32 in lines
+        result = result and 'GLUE2ComputingShareServingState: draining' in lines
+        result = result and 'GLUE2ComputingShareFreeAcceleratorSlots: GPU:1' in lines
+        self.assertTrue(result and 'GLUE2EntityCreationTime: %s' % self.now in lines)
+
+    def test_glue2_no_accelerators(self):
+        lines = self._render(None, { 'dn: GLUE2ShareID=share1' : 'cert' }, None)
+        self.assertTrue('GLUE2ComputingShareFreeAcceleratorSlots: GPU:1' not in lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import unittest
+from StringIO import StringIO
+
+from TorqueInfoUtils import JobFormat
+
+
+class JobFormatTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.header = 'nactive      4\nnfree        2\nnow          1377074245\nschedCycle   26\n'
+        self.jobList = [
+            { 'jobid' : '01.cert-34.pd.infn.it', 'name' : 'cream_921657923', 'user' : 'dteam013',
+              'group' : 'dteam', 'state' : 'running', 'queue' : 'cert', 'qtime' : 1377074245,
+              'start' : 1377074246, 'startAnchor' : 'start_time', 'walltime' : 60,
+              'maxwalltime' : 129600, 'cpucount' : 2 },
+            { 'jobid' : '02.cert-34.pd.infn.it', 'user' : 'dteam013', 'group' : '__localgroup__',
+              'state' : 'queued', 'queue' : 'cert', 'qtime' : 1377074250 }
+        ]
+
+    def _roundTrip(self, fmt):
+        outStream = StringIO()
+        outStream.write(self.header)
+        writer = JobFormat.JobWriter(outStream, fmt)
+        for jTable in self.jobList:
+            writer.write(jTable)
+        writer.flush()
+        
+        infoTable, jobList = JobFormat.readLRMSInfo(StringIO(outStream.getvalue()))
+        result = infoTable['nactive'] == '4' and infoTable['schedCycle'] == '26'
+        return result and jobList == self.jobList
+
+    def test_dict_format_ok(self):
+        self.assertTrue(self._roundTrip('dict'))
+
+    def test_json_format_ok(self):
+        self.assertTrue(self._roundTrip('json'))
+
+    def test_tsv_format_ok(self):
+        self.assertTrue(self._roundTrip('tsv'))
+
+    def test_unknown_format(self):
+        self.assertRaises(Exception, JobFormat.JobWriter, sys.stdout, 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
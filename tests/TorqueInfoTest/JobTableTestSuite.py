@@ -0,0 +1,102 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import unittest
+
+from TorqueInfoUtils import JobTable
+from TestUtils import Workspace
+
+
+class JobTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = Workspace()
+        self.numpy = JobTable.numpy
+        
+        self.table = JobTable.JobTable()
+        self.table.append({ 'jobid' : '1.ce', 'queue' : 'cert', 'group' : 'dteam', 'state' : 'running',
+                            'qtime' : 1000, 'start' : 1100, 'walltime' : 60, 'cpucount' : 2 })
+        self.table.append({ 'jobid' : '2.ce', 'queue' : 'cert', 'group' : 'dteam', 'state' : 'queued',
+                            'qtime' : 1200 })
+        self.table.append({ 'jobid' : '3.ce', 'queue' : 'cert', 'group' : 'infngrid', 'state' : 'running',
+                            'qtime' : 900, 'start' : 1000, 'walltime' : 160, 'cpucount' : 4 })
+        self.table.append({ 'jobid' : '4.ce', 'queue' : 'long', 'group' : 'dteam', 'state' : 'running',
+                            'qtime' : 800, 'start' : 1200, 'walltime' : 10, 'cpucount' : 1 })
+
+    def tearDown(self):
+        JobTable.numpy = self.numpy
+
+    def _checkAggregates(self):
+        result = self.table.groupBy('queue') == { 'cert' : 3, 'long' : 1 }
+        result = result and self.table.groupBy(('queue', 'state'), 'sum', 'cpucount') == \
+            { ('cert', 'running') : 6, ('long', 'running') : 1 }
+        result = result and self.table.groupBy('group', 'min', 'qtime') == { 'dteam' : 800, 'infngrid' : 900 }
+        result = result and self.table.groupBy('queue', 'max', 'walltime') == { 'cert' : 160, 'long' : 10 }
+        result = result and self.table.groupBy('state', 'count', 'start') == { 'running' : 3 }
+        
+        #
+        # a real -1 is a value, the missing group is not counted
+        #
+        table = JobTable.JobTable()
+        table.append({ 'jobid' : '5.ce', 'queue' : 'long', 'group' : 'dteam', 'maxwalltime' : -1 })
+        table.append({ 'jobid' : '6.ce', 'queue' : 'long' })
+        result = result and table.groupBy('queue', 'count', 'group') == { 'long' : 1 }
+        result = result and table.groupBy('queue', 'min', 'maxwalltime') == { 'long' : -1 }
+        try:
+            table.groupBy('queue', 'sum', 'group')
+            result = False
+        except Exception:
+            pass
+        return result
+
+    def test_group_by_numpy(self):
+        if JobTable.numpy == None:
+            self.skipTest("numpy not available")
+        self.assertTrue(self._checkAggregates())
+
+    def test_group_by_array(self):
+        JobTable.numpy = None
+        self.assertTrue(self._checkAggregates())
+
+    def test_empty_table(self):
+        table = JobTable.JobTable()
+        self.assertTrue(table.groupBy('queue') == {} and table.groupBy('queue', 'sum', 'cpucount') == {})
+
+    def test_parse_ok(self):
+        tmpfile = self.workspace.createFile('''Job Id: 15.cert-34.pd.infn.it
+    Job_Owner = dteam013@cert-34.pd.infn.it
+    egroup = dteam
+    job_state = Q
+    queue = cert
+    qtime = Wed Aug 21 11:37:25 2013
+
+Job Id: 16.cert-34.pd.infn.it
+    Job_Owner = dteam013@cert-34.pd.infn.it
+    egroup = dteam
+    job_state = R
+    queue = cert
+    exec_host = wn-01.pd.infn.it/0+wn-01.pd.infn.it/1
+    resources_used.walltime = 01:00:00
+
+''')
+        table = JobTable.parse(None, tmpfile)
+        result = len(table) == 2 and table.groupBy('state') == { 'queued' : 1, 'running' : 1 }
+        self.assertTrue(result and table.groupBy('queue', 'sum', 'walltime') == { 'cert' : 3600 })
+
+
+if __name__ == '__main__':
+    unittest.main()
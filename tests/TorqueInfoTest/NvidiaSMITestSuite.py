@@ -0,0 +1,244 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import os, os.path
+import socket
+import time
+import unittest
+
+from TorqueInfoUtils import CommonUtils
+from TorqueInfoUtils import NvidiaSMIHandler
+from TestUtils import Workspace
+
+
+class NvidiaSMITestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = Workspace()
+        
+        #
+        # fake ssh: the node name selects the nvidia-smi answer,
+        #           nodes named "broken*" fail, the master connection
+        #           to nodes named "wedged*" hangs
+        #
+        self.sshScript = '''#!/bin/sh
+echo "$@" >> %s/ssh.log
+node=
+master=
+while [ $# -gt 0 ] ; do
+    case $1 in
+        -o|-O) shift ;;
+        -N) master=yes ;;
+        -f) ;;
+        *) node=$1; break ;;
+    esac
+    shift
+done
+case $node in
+    wedged*) [ -n "$master" ] && sleep 30 ;;
+    broken*) echo "ssh: connect to host $node: No route to host" >&2; exit 255 ;;
+    busy*) echo "GPU-0001, 1234"; echo "GPU-0002, 1235" ;;
+    half*) echo "GPU-0001, 1234" ;;
+esac
+exit 0
+''' % self.workspace.workspace
+        self.workspace.createExecutable('ssh', self.sshScript)
+        self.oldPath = os.environ['PATH']
+        os.environ['PATH'] = self.workspace.workspace + ':' + self.oldPath
+
+    def tearDown(self):
+        os.environ['PATH'] = self.oldPath
+        CommonUtils.setCommandTimeouts({})
+
+    def _gpuStats(self, total, free, state='free'):
+        return { 'node_state' : state, 'total_gpus' : total, 'free_gpus' : free }
+
+    def test_parse_gpu_info_ok(self):
+        
+        container = NvidiaSMIHandler.parseGPUInfo('busy01')
+        self.assertTrue(len(container.num_of_procs) == 2)
+
+    def test_probe_engine_ok(self):
+        
+        gpuTable = dict()
+        for idx in range(10):
+            gpuTable['busy%02d' % idx] = self._gpuStats(4, 4)
+            gpuTable['half%02d' % idx] = self._gpuStats(2, 2)
+        
+        engine = NvidiaSMIHandler.GPUProbeEngine(3)
+        engine.probe(gpuTable)
+        result = engine.freeGPUSlots == 30 and engine.usedGPUSlots == 30
+        self.assertTrue(result and len(engine.errList) == 0)
+
+    def test_probe_engine_fallback(self):
+        
+        gpuTable = dict()
+        gpuTable['busy01'] = self._gpuStats(2, 2)
+        gpuTable['broken01'] = self._gpuStats(4, 1)
+        gpuTable['half01'] = self._gpuStats(2, 0, 'down')
+        
+        engine = NvidiaSMIHandler.GPUProbeEngine(2)
+        engine.probe(gpuTable)
+        result = engine.freeGPUSlots == 1 and engine.usedGPUSlots == 5
+        self.assertTrue(result and len(engine.errList) == 1)
+
+
+    def test_transport_command(self):
+        
+        transport = NvidiaSMIHandler.SSHTransport(os.path.join(self.workspace.workspace, 'ctl'))
+        container = NvidiaSMIHandler.parseGPUInfo('half01', None, transport)
+        
+        logFile = open(os.path.join(self.workspace.workspace, 'ssh.log'))
+        sshCalls = logFile.readlines()
+        logFile.close()
+        
+        result = len(container.num_of_procs) == 1
+        result = result and 'ControlMaster=yes' in sshCalls[0] and '-N' in sshCalls[0]
+        result = result and 'ControlPath=%s/ctl/half01' % self.workspace.workspace in sshCalls[1]
+        self.assertTrue(result)
+
+    def test_transport_master_timeout(self):
+        
+        CommonUtils.setCommandTimeouts({ 'ssh' : 1 })
+        transport = NvidiaSMIHandler.SSHTransport(os.path.join(self.workspace.workspace, 'ctl'))
+        
+        startTime = time.time()
+        try:
+            NvidiaSMIHandler.parseGPUInfo('wedged01', None, transport)
+            result = False
+        except CommonUtils.CommandTimeout:
+            result = True
+        
+        #
+        # no plain connection after the master failed
+        #
+        result = result and time.time() - startTime < 3 and self._sshCalls() == 1
+        self.assertTrue(result)
+
+    def test_transport_master_failure(self):
+        
+        transport = NvidiaSMIHandler.SSHTransport(os.path.join(self.workspace.workspace, 'ctl'))
+        self.assertRaises(Exception, NvidiaSMIHandler.parseGPUInfo, 'broken01', None, transport)
+        self.assertTrue(self._sshCalls() == 1)
+
+    def test_transport_cleanup_stale(self):
+        
+        ctlDir = os.path.join(self.workspace.workspace, 'ctl')
+        transport = NvidiaSMIHandler.SSHTransport(ctlDir)
+        
+        deadSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        deadSocket.bind(os.path.join(ctlDir, 'busy01'))
+        deadSocket.close()
+        
+        liveSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        liveSocket.bind(os.path.join(ctlDir, 'busy02'))
+        liveSocket.listen(1)
+        
+        try:
+            evicted = transport.cleanup(['busy01', 'busy02'])
+            result = evicted == 1 and os.listdir(ctlDir) == ['busy02']
+            evicted = transport.cleanup(['busy01'])
+            result = result and evicted == 1 and len(os.listdir(ctlDir)) == 0
+        finally:
+            liveSocket.close()
+        self.assertTrue(result)
+
+    def _sshCalls(self):
+        logName = os.path.join(self.workspace.workspace, 'ssh.log')
+        if not os.path.exists(logName):
+            return 0
+        logFile = open(logName)
+        try:
+            return len(logFile.readlines())
+        finally:
+            logFile.close()
+
+    def test_probe_engine_cache(self):
+        
+        cacheFile = os.path.join(self.workspace.workspace, 'gpu.cache')
+        gpuTable = dict()
+        for idx in range(4):
+            gpuTable['busy%02d' % idx] = self._gpuStats(4, 4)
+            gpuTable['busy%02d' % idx]['fingerprint'] = 'jobs%d' % idx
+        
+        engine = NvidiaSMIHandler.GPUProbeEngine(2, None, NvidiaSMIHandler.GPUResultCache(cacheFile))
+        engine.probe(gpuTable)
+        result = self._sshCalls() == 4
+        
+        #
+        # a new run: only the node with a different job set is probed again
+        #
+        gpuTable['busy03']['fingerprint'] = 'jobs3-changed'
+        engine = NvidiaSMIHandler.GPUProbeEngine(2, None, NvidiaSMIHandler.GPUResultCache(cacheFile))
+        engine.probe(gpuTable)
+        result = result and self._sshCalls() == 5 and engine.cache.hits == 3
+        self.assertTrue(result and engine.freeGPUSlots == 8 and engine.usedGPUSlots == 8)
+
+    def test_probe_engine_cache_expired(self):
+        
+        gpuTable = { 'half01' : self._gpuStats(2, 2) }
+        gpuTable['half01']['fingerprint'] = 'jobs'
+        
+        cache = NvidiaSMIHandler.GPUResultCache(None, -1)
+        NvidiaSMIHandler.GPUProbeEngine(1, None, cache).probe(gpuTable)
+        NvidiaSMIHandler.GPUProbeEngine(1, None, cache).probe(gpuTable)
+        self.assertTrue(self._sshCalls() == 2 and cache.hits == 0)
+
+    def test_probe_engine_circuit_open(self):
+        
+        stateFile = os.path.join(self.workspace.workspace, 'circuits')
+        gpuTable = { 'broken01' : self._gpuStats(4, 1), 'busy01' : self._gpuStats(2, 2) }
+        
+        engine = NvidiaSMIHandler.GPUProbeEngine(2, None, None, NvidiaSMIHandler.GPUCircuitBreaker(stateFile))
+        engine.probe(gpuTable)
+        result = self._sshCalls() == 2 and len(engine.errList) == 1
+        
+        #
+        # next run: the broken node is skipped, pbsnodes figures are used
+        #
+        engine = NvidiaSMIHandler.GPUProbeEngine(2, None, None, NvidiaSMIHandler.GPUCircuitBreaker(stateFile))
+        engine.probe(gpuTable)
+        result = result and self._sshCalls() == 3 and engine.skipped == 1 and len(engine.errList) == 0
+        self.assertTrue(result and engine.freeGPUSlots == 1 and engine.usedGPUSlots == 5)
+
+    def test_probe_engine_deadline(self):
+        
+        gpuTable = dict()
+        for idx in range(4):
+            gpuTable['busy%02d' % idx] = self._gpuStats(4, 3)
+        
+        engine = NvidiaSMIHandler.GPUProbeEngine(2)
+        engine.probe(gpuTable, time.time() - 1)
+        result = engine.expired == 4 and self._sshCalls() == 0
+        self.assertTrue(result and engine.freeGPUSlots == 12 and engine.usedGPUSlots == 4)
+
+    def test_circuit_backoff(self):
+        
+        breaker = NvidiaSMIHandler.GPUCircuitBreaker(None, 10, 25)
+        breaker.registerFailure('broken01')
+        firstRetry = breaker.retryTimes['broken01'] - time.time()
+        breaker.registerFailure('broken01')
+        breaker.registerFailure('broken01')
+        lastRetry = breaker.retryTimes['broken01'] - time.time()
+        result = breaker.isOpen('broken01') and 8 <= firstRetry <= 10 and 23 <= lastRetry <= 25
+        
+        breaker.registerSuccess('broken01')
+        self.assertTrue(result and not breaker.isOpen('broken01'))
+
+
+if __name__ == '__main__':
+    unittest.main()
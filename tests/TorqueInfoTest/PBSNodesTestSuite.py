@@ -18,6 +18,7 @@ import sys
 import unittest
 
 from TorqueInfoUtils import PBSNodesHandler
+from TorqueInfoUtils import CommonUtils
 from TestUtils import Workspace
 
 
@@ -97,7 +98,86 @@ class PBSNodesTestCase(unittest.TestCase):
         except Exception, ex:
             msg = str(ex)
             self.assertTrue(msg.startswith("invalid literal for int"))
-    
+
+    def test_parse_mmap_file(self):
+
+        pattern_args = {'host' : 'cert-wn64-01', 'state' : 'free', 'np' : '8'}
+        tmpfile = self.workspace.createFile(self.pbsnodesPattern % pattern_args)
+        
+        container = PBSNodesHandler.CPUInfoHandler()
+        CommonUtils.parseFile(tmpfile, container, True)
+        self.assertTrue(container.totalCPU == 8 and container.freeCPU == 8)
+
+    def test_node_index_ok(self):
+
+        pattern_args = {'host' : 'cert-wn64-01', 'state' : 'free', 'np' : '4'}
+        tmps = self.pbsnodesPattern % pattern_args
+        tmps += '     jobs = 0/15.cert-34.pd.infn.it, 1/16.cert-34.pd.infn.it\n'
+        tmpfile = self.workspace.createFile(tmps)
+        
+        pattern_args = {'host' : 'cert-wn64-02', 'state' : 'down', 'np' : '2'}
+        self.workspace.appendToFile(self.pbsnodesPattern % pattern_args, tmpfile)
+        
+        container = PBSNodesHandler.parseCPUInfo(None, tmpfile)
+        record = container.node('cert-wn64-01.pn.pd.infn.it')
+        
+        result = len(container.nodes) == 2 and record.np == 4 and record.freeSlots() == 2
+        result = result and record.jobIds == ('15.cert-34.pd.infn.it', '16.cert-34.pd.infn.it')
+        result = result and not container.node('cert-wn64-02.pn.pd.infn.it').isUp()
+        result = result and len(container.nodesWithProperty('lcgpro')) == 2
+        self.assertTrue(result and container.node('missing') == None)
+
+    def test_parse_job_slot_ranges(self):
+
+        jobSlots, jobIds = PBSNodesHandler.parseJobSlots('0-2,5/15.cert-34.pd.infn.it,3/16.cert-34.pd.infn.it')
+        
+        result = list(jobSlots) == [0, 1, 2, 5, 3]
+        self.assertTrue(result and jobIds.count('15.cert-34.pd.infn.it') == 4)
+
+    def test_gpu_fingerprint(self):
+
+        pattern_args = {'host' : 'cert-wn64-01', 'state' : 'free', 'np' : '4'}
+        tmps = self.pbsnodesPattern % pattern_args
+        tmps += '     gpu_status = gpu[0]=gpu_utilization=0%;gpu_memory_utilization=0%\n'
+        tmpfile1 = self.workspace.createFile(tmps)
+        tmpfile2 = self.workspace.createFile(tmps + '     jobs = 0/15.cert-34.pd.infn.it\n')
+        
+        gpuStats1 = PBSNodesHandler.parseCPUInfo(None, tmpfile1).gpuTable['cert-wn64-01.pn.pd.infn.it']
+        gpuStats2 = PBSNodesHandler.parseCPUInfo(None, tmpfile2).gpuTable['cert-wn64-01.pn.pd.infn.it']
+        gpuStats3 = PBSNodesHandler.parseCPUInfo(None, tmpfile1).gpuTable['cert-wn64-01.pn.pd.infn.it']
+        
+        result = gpuStats1['free_gpus'] == 1 and gpuStats1['fingerprint'] <> gpuStats2['fingerprint']
+        self.assertTrue(result and gpuStats1['fingerprint'] == gpuStats3['fingerprint'])
+
+    def test_gpu_fingerprint_timestamp(self):
+
+        gpuPattern = 'gpu[1]=gpu_id=0000:04:00.0;gpu_memory_used=%(mem)d MB;gpu_mode=Default;'
+        gpuPattern += 'gpu_state=Unallocated;gpu_utilization=0%%;gpu_memory_utilization=0%%;'
+        gpuPattern += 'gpu_temperature=%(temp)d C,gpu[0]=gpu_id=0000:03:00.0;gpu_mode=Default;'
+        gpuPattern += 'gpu_state=Unallocated;gpu_utilization=0%%;gpu_memory_utilization=0%%,'
+        gpuPattern += 'driver_ver=319.37,timestamp=Thu Oct 10 10:39:%(sec)02d 2013'
+        
+        pattern_args = {'host' : 'cert-wn64-01', 'state' : 'free', 'np' : '4'}
+        tmps = self.pbsnodesPattern % pattern_args
+        tmpfile1 = self.workspace.createFile(tmps + '     gpu_status = %s\n' 
+                                             % (gpuPattern % { 'mem' : 10, 'temp' : 36, 'sec' : 25 }))
+        tmpfile2 = self.workspace.createFile(tmps + '     gpu_status = %s\n' 
+                                             % (gpuPattern % { 'mem' : 12, 'temp' : 37, 'sec' : 55 }))
+        
+        gpuStats1 = PBSNodesHandler.parseCPUInfo(None, tmpfile1).gpuTable['cert-wn64-01.pn.pd.infn.it']
+        gpuStats2 = PBSNodesHandler.parseCPUInfo(None, tmpfile2).gpuTable['cert-wn64-01.pn.pd.infn.it']
+        
+        result = gpuStats1['total_gpus'] == 2 and gpuStats1['free_gpus'] == 2
+        self.assertTrue(result and gpuStats1['fingerprint'] == gpuStats2['fingerprint'])
+
+    def test_parse_missing_file(self):
+        
+        try:
+            PBSNodesHandler.parseCPUInfo(None, '/tmp/infopbstest/nonexistent.txt')
+            self.fail("No exception detected")
+        except Exception, ex:
+            self.assertTrue('No such file or directory' in str(ex))
+
 
 
 if __name__ == '__main__':
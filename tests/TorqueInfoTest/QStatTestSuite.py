@@ -15,9 +15,12 @@
 # limitations under the License.
 
 import sys
+import os
+import time
 import unittest
 
 from TorqueInfoUtils import QStatHandler
+from TorqueInfoUtils import CommonUtils
 from TestUtils import Workspace
 
 
@@ -151,7 +154,7 @@ Queue: %(queue)s
         QStatHandler.parse(outList, None, tmpfile)
         qtimeCount = 0
         for jtable in outList:
-            if jtable['qtime'] == 1377074245 or jtable['qtime'] == 1377074250:
+            if jtable['qtime'] == 1377077845 or jtable['qtime'] == 1377077850:
                 qtimeCount += 1
         self.assertTrue(qtimeCount == 2) 
         
@@ -178,12 +181,268 @@ Queue: %(queue)s
         stimeCount = 0
         for jtable in outList:
             try:
-                if jtable['start'] == 1377074246 and jtable['startAnchor'] == 'start_time':
+                if jtable['start'] == 1377077846 and jtable['startAnchor'] == 'start_time':
                     stimeCount += 1
             except:
                 pass
         self.assertTrue(stimeCount == 1) 
          
+    def test_iter_jobs_ok(self):
+    
+        tmpfile = self.workspace.createFile('')
+        for idx in range(5):
+            pattern_args = {'jserial' : idx, 
+                            'jname' : 'cream_%d' % idx, 
+                            'jstate' : 'R',
+                            'qtime' : 'Wed Aug 21 11:37:25 2013',
+                            'queue' : 'cert',
+                            'pair1' : 'dummy1 = None'}
+            self.workspace.appendToFile(self.jobPattern % pattern_args, tmpfile)
+        
+        jobIds = [ jTable['jobid'] for jTable in QStatHandler.iterJobs(None, tmpfile) ]
+        self.assertTrue(jobIds == [ '%d.cert-34.pd.infn.it' % idx for idx in range(5) ])
+
+    def test_iter_jobs_early_stop(self):
+    
+        pattern_args = {'jserial' : 1, 
+                        'jname' : 'cream_1', 
+                        'jstate' : 'R',
+                        'qtime' : 'Wed Aug 21 11:37:25 2013',
+                        'queue' : 'cert',
+                        'pair1' : 'dummy1 = None'}
+        tmpfile = self.workspace.createFile(self.jobPattern % pattern_args)
+        
+        cmd = ['sh', '-c', 'while true ; do cat %s ; done' % tmpfile]
+        handler = QStatHandler.PBSJobHandler(None)
+        records = CommonUtils.iterStream(cmd, handler)
+        for idx in range(3):
+            jTable = records.next()
+        records.close()
+        self.assertTrue(jTable['queue'] == 'cert')
+
+    def test_iter_jobs_compact(self):
+    
+        pattern_args = {'jserial' : 1, 
+                        'jname' : 'cream_1', 
+                        'jstate' : 'R',
+                        'qtime' : 'Wed Aug 21 11:37:25 2013',
+                        'queue' : 'cert',
+                        'pair1' : 'start_time = Wed Aug 21 11:37:26 2013'}
+        tmpfile = self.workspace.createFile(self.jobPattern % pattern_args)
+        
+        dictList = list(QStatHandler.iterJobs(None, tmpfile))
+        recList = list(QStatHandler.iterJobs(None, tmpfile, None, True))
+        
+        jRecord = recList[0]
+        result = isinstance(jRecord, QStatHandler.JobRecord)
+        result = result and jRecord == dictList[0] and str(jRecord) == str(dictList[0])
+        result = result and jRecord['queue'] == 'cert' and not 'cpucount' in jRecord
+        self.assertTrue(result and jRecord.get('cpucount', 0) == 0)
+
+    def test_job_record_keys(self):
+    
+        jRecord = QStatHandler.JobRecord()
+        jRecord['queue'] = 'cert'
+        
+        result = 'queue' in jRecord and not 'keys' in jRecord and not 'interned' in jRecord
+        result = result and jRecord.get('__class__') == None and jRecord.get('items', 0) == 0
+        for key in [ 'interned', 'keys', 'start' ]:
+            try:
+                jRecord[key]
+                result = False
+            except KeyError:
+                pass
+        try:
+            jRecord['keys'] = 'cert'
+            result = False
+        except KeyError:
+            pass
+        self.assertTrue(result and jRecord.keys() == ['queue'])
+
+    def _setupFakeQstat(self, jobStates, queues={}):
+        dataDir = self.workspace.workspace
+        
+        listing = 'Job ID                    Name             User            Time Use S Queue\n'
+        listing += '------------------------- ---------------- --------------- -------- - -----\n'
+        for serial, jstate in jobStates:
+            queue = queues.get(serial, 'cert')
+            listing += '%s.cert-34.pd.infn.it  cream_%s  dteam013  00:00:00 %s %s\n' % (serial, serial, jstate, queue)
+            pattern_args = {'jserial' : serial, 
+                            'jname' : 'cream_%s' % serial, 
+                            'jstate' : jstate,
+                            'qtime' : 'Wed Aug 21 11:37:25 2013',
+                            'queue' : queue,
+                            'pair1' : 'start_time = Wed Aug 21 11:37:26 2013'}
+            jobFile = open('%s/job%s.txt' % (dataDir, serial), 'w')
+            jobFile.write(self.jobPattern % pattern_args)
+            jobFile.close()
+        
+        listFile = open(dataDir + '/list.txt', 'w')
+        listFile.write(listing)
+        listFile.close()
+        
+        #
+        # like Torque, the fake qstat -f reports the jobs without a
+        # job file as unknown and exits with a non-zero code
+        #
+        script = '''#!/bin/sh
+echo "$@" >> %(dir)s/qstat.log
+if [ $# -eq 0 ] ; then cat %(dir)s/list.txt ; exit 0 ; fi
+shift
+if [ $# -eq 0 ] ; then set -- %(all)s ; fi
+retcode=0
+for serial in "$@" ; do
+    if [ -f %(dir)s/job$serial.txt ] ; then
+        cat %(dir)s/job$serial.txt
+    else
+        echo "qstat: Unknown Job Id $serial" >&2
+        retcode=153
+    fi
+done
+exit $retcode
+''' % { 'dir' : dataDir, 'all' : ' '.join([ serial for serial, jstate in jobStates ]) }
+        self.workspace.createExecutable('qstat', script)
+
+    def test_delta_collector_ok(self):
+    
+        oldPath = os.environ['PATH']
+        os.environ['PATH'] = self.workspace.workspace + ':' + oldPath
+        try:
+            stateFile = self.workspace.workspace + '/jobs.state'
+            
+            self._setupFakeQstat([('01', 'R'), ('02', 'Q'), ('03', 'Q')])
+            collector = QStatHandler.DeltaCollector(stateFile)
+            firstList = collector.collect()
+            result = len(firstList) == 3 and collector.fetched == 3
+            
+            self._setupFakeQstat([('01', 'R'), ('02', 'R'), ('04', 'Q')])
+            collector = QStatHandler.DeltaCollector(stateFile)
+            deltaList = collector.collect()
+            result = result and collector.fetched == 2
+            
+            fullList = list()
+            QStatHandler.parse(fullList)
+        finally:
+            os.environ['PATH'] = oldPath
+        
+        for jTable in deltaList + fullList:
+            del jTable['walltime']
+        self.assertTrue(result and deltaList == fullList)
+
+    def _fullScans(self):
+        logFile = open(self.workspace.workspace + '/qstat.log')
+        try:
+            return len([ line for line in logFile if line.strip() == '-f' ])
+        finally:
+            logFile.close()
+
+    def test_delta_collector_finished(self):
+    
+        oldPath = os.environ['PATH']
+        os.environ['PATH'] = self.workspace.workspace + ':' + oldPath
+        try:
+            stateFile = self.workspace.workspace + '/jobs.state'
+            
+            self._setupFakeQstat([('01', 'R'), ('02', 'Q')])
+            QStatHandler.DeltaCollector(stateFile).collect()
+            
+            #
+            # job 03 finishes between the listing and qstat -f
+            #
+            self._setupFakeQstat([('01', 'R'), ('02', 'R'), ('03', 'Q')])
+            os.remove(self.workspace.workspace + '/job03.txt')
+            collector = QStatHandler.DeltaCollector(stateFile)
+            deltaList = collector.collect()
+            result = self._fullScans() == 1 and collector.fetched == 2
+        finally:
+            os.environ['PATH'] = oldPath
+        
+        serials = [ QStatHandler.jobSerial(jTable['jobid']) for jTable in deltaList ]
+        self.assertTrue(result and serials == ['01', '02'] and deltaList[1]['state'] == 'running')
+
+    def test_delta_collector_qstat_error(self):
+    
+        oldPath = os.environ['PATH']
+        os.environ['PATH'] = self.workspace.workspace + ':' + oldPath
+        try:
+            stateFile = self.workspace.workspace + '/jobs.state'
+            
+            self._setupFakeQstat([('01', 'R'), ('02', 'Q')])
+            QStatHandler.DeltaCollector(stateFile).collect()
+            self._setupFakeQstat([('01', 'R'), ('02', 'R')])
+            
+            #
+            # any other error falls back to a full scan
+            #
+            script = open(self.workspace.workspace + '/qstat').read()
+            script = script.replace('shift\n', 'shift\n[ $# -gt 0 ] && echo "qstat: cannot connect to server" >&2 && exit 1\n')
+            self.workspace.createExecutable('qstat', script)
+            deltaList = QStatHandler.DeltaCollector(stateFile).collect()
+        finally:
+            os.environ['PATH'] = oldPath
+        
+        self.assertTrue(self._fullScans() == 2 and len(deltaList) == 2)
+
+    def test_delta_collector_qmove(self):
+    
+        oldPath = os.environ['PATH']
+        os.environ['PATH'] = self.workspace.workspace + ':' + oldPath
+        try:
+            stateFile = self.workspace.workspace + '/jobs.state'
+            
+            self._setupFakeQstat([('01', 'Q'), ('02', 'Q')])
+            QStatHandler.DeltaCollector(stateFile).collect()
+            
+            #
+            # same state, different queue
+            #
+            self._setupFakeQstat([('01', 'Q'), ('02', 'Q')], { '01' : 'long' })
+            collector = QStatHandler.DeltaCollector(stateFile)
+            deltaList = collector.collect()
+            result = collector.fetched == 1
+            
+            fullList = list()
+            QStatHandler.parse(fullList)
+        finally:
+            os.environ['PATH'] = oldPath
+        
+        for jTable in deltaList + fullList:
+            jTable.pop('walltime', None)
+        self.assertTrue(result and deltaList == fullList and deltaList[0]['queue'] == 'long')
+
+    def test_convert_time_ok(self):
+    
+        converter = QStatHandler.TimestampConverter()
+        result = True
+        for tStr in ['Wed Aug 21 11:37:25 2013', 'Wed Jan  8 10:00:00 2014', 
+                     'Sun Oct 27 02:30:00 2013', 'Wed Aug 21 11:37:25 2013']:
+            expected = int(time.mktime(time.strptime(tStr, "%c")))
+            result = result and converter.convert(tStr) == expected
+        self.assertTrue(result and converter.misses == 3)
+
+    def test_convert_time_bounded(self):
+    
+        converter = QStatHandler.TimestampConverter(4)
+        for sec in range(10):
+            converter.convert('Wed Aug 21 11:37:%02d 2013' % sec)
+        self.assertTrue(len(converter.cache) <= 4)
+
+    def test_group_resolver_cached(self):
+    
+        cacheFile = self.workspace.workspace + '/groups.cache'
+        resolver = QStatHandler.GroupResolver(cacheFile)
+        rootGroup = resolver.resolve('root')
+        resolver.resolve('root')
+        resolver.resolve('no-such-user-here')
+        resolver.resolve('no-such-user-here')
+        resolver.save()
+        result = rootGroup <> None and resolver.lookups == 2
+        
+        resolver = QStatHandler.GroupResolver(cacheFile)
+        result = result and resolver.resolve('root') == rootGroup
+        result = result and resolver.resolve('no-such-user-here') == None
+        self.assertTrue(result and resolver.lookups == 0)
+
     def test_parse_queue_ok(self):
         
         pattern_args = {'queue' : 'cert', 'maxcpu' : '24:00:00', 'maxwt' : '36:00:00'}
@@ -194,6 +453,58 @@ Queue: %(queue)s
         result = result and container.maxWallTime == 129600
         self.assertTrue(result)
 
+    def test_parse_multi_queue_ok(self):
+        
+        pattern_args = {'queue' : 'cert', 'maxcpu' : '24:00:00', 'maxwt' : '36:00:00'}
+        tmpfile = self.workspace.createFile(self.queuePattern % pattern_args)
+        
+        pattern_args = {'queue' : 'long', 'maxcpu' : '48:00:00', 'maxwt' : '72:00:00'}
+        self.workspace.appendToFile(self.queuePattern % pattern_args, tmpfile)
+        
+        pattern_args = {'queue' : 'short', 'maxcpu' : '01:00:00', 'maxwt' : '02:00:00'}
+        self.workspace.appendToFile(self.queuePattern % pattern_args, tmpfile)
+        
+        handlers = QStatHandler.parseMultiQueueInfo(['cert', 'long'], None, tmpfile)
+        result = len(handlers) == 2
+        result = result and handlers['cert'].maxCPUtime == 86400
+        result = result and handlers['long'].maxWallTime == 259200
+        result = result and handlers['long'].state == 'Production'
+        self.assertTrue(result)
+
+    def test_parse_multi_queue_defaults(self):
+        
+        srvfile = self.workspace.createFile('Server: cert-34.pd.infn.it\n    resources_default.mem = 2gb\n')
+        slh = QStatHandler.parseQueueInfo(None, None, srvfile)
+        
+        pattern_args = {'queue' : 'cert', 'maxcpu' : '24:00:00', 'maxwt' : '36:00:00'}
+        tmpfile = self.workspace.createFile(self.queuePattern % pattern_args)
+        
+        handlers = QStatHandler.parseMultiQueueInfo(None, None, tmpfile, slh)
+        self.assertTrue(handlers['cert'].maxMem == 2048)
+
+    def test_parse_server_info_ok(self):
+        pattern = self.srvPattern % {'lrmsver' : '2.5.7'}
+        pattern += '    resources_max.walltime = 48:00:00\n'
+        
+        tmpfile = self.workspace.createFile(pattern)
+        serverInfo = QStatHandler.parseServerInfo(None, tmpfile)
+        
+        result = QStatHandler.parseLRMSVersion(serverInfo=serverInfo) == '2.5.7'
+        result = result and serverInfo.stateCount['Queued'] == 3
+        result = result and serverInfo.stateCount['Waiting'] == -3
+        self.assertTrue(result and serverInfo.maxWallTime == 172800)
+
+    def test_server_info_queue_defaults(self):
+        srvfile = self.workspace.createFile(self.srvPattern % {'lrmsver' : '2.5.7'}
+                                            + '    resources_default.mem = 2gb\n')
+        serverInfo = QStatHandler.parseServerInfo(None, srvfile)
+        
+        pattern_args = {'queue' : 'cert', 'maxcpu' : '24:00:00', 'maxwt' : '36:00:00'}
+        tmpfile = self.workspace.createFile(self.queuePattern % pattern_args)
+        
+        handlers = QStatHandler.parseMultiQueueInfo(None, None, tmpfile, serverInfo)
+        self.assertTrue(handlers['cert'].maxMem == 2048 and not hasattr(handlers['cert'], 'version'))
+
 if __name__ == '__main__':
     unittest.main()
 
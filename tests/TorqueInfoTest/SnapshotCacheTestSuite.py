@@ -0,0 +1,205 @@
+# Copyright (c) Members of the EGEE Collaboration. 2004. 
+# See http://www.eu-egee.org/partners/ for details on the copyright
+# holders.  
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. 
+# You may obtain a copy of the License at 
+#
+#     http://www.apache.org/licenses/LICENSE-2.0 
+#
+# Unless required by applicable law or agreed to in writing, software 
+# distributed under the License is distributed on an "AS IS" BASIS, 
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. 
+# See the License for the specific language governing permissions and 
+# limitations under the License.
+
+import sys
+import os, os.path
+import time
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+from TorqueInfoUtils import SnapshotCache
+from TorqueInfoUtils import PBSNodesHandler
+from TorqueInfoUtils import QStatHandler
+from TestUtils import Workspace
+
+
+class SnapshotCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = Workspace()
+        self.cacheDir = os.path.join(self.workspace.workspace, 'snapshots')
+        
+        self.pbsnodesPattern = '''cert-wn64-01.pn.pd.infn.it
+     state = free
+     np = 4
+     jobs = 0/15.cert-34.pd.infn.it
+     gpu_status = gpu[0]=gpu_utilization=0%;gpu_memory_utilization=0%
+
+'''
+
+    def test_put_get_ok(self):
+        
+        cache = SnapshotCache.SnapshotCache(self.cacheDir)
+        cache.put('diagnose', { 'dteam' : 50 }, 'cert-34.pd.infn.it')
+        
+        result = cache.get('diagnose', 'cert-34.pd.infn.it') == { 'dteam' : 50 }
+        result = result and cache.get('diagnose') == None
+        self.assertTrue(result and os.listdir(self.cacheDir) == ['diagnose@cert-34.pd.infn.it'])
+
+    def test_expired(self):
+        
+        cache = SnapshotCache.SnapshotCache(self.cacheDir)
+        cache.put('lrmsver', '2.5.7')
+        self.assertTrue(cache.get('lrmsver', None, -1) == None)
+
+    def test_disabled(self):
+        
+        cache = SnapshotCache.SnapshotCache()
+        cache.put('lrmsver', '2.5.7')
+        self.assertTrue(cache.get('lrmsver') == None)
+
+    def test_insecure_dir(self):
+        
+        os.mkdir(self.cacheDir)
+        os.chmod(self.cacheDir, 0777)
+        cache = SnapshotCache.SnapshotCache(self.cacheDir)
+        cache.put('lrmsver', '2.5.7')
+        self.assertTrue(cache.cacheDir == None and os.listdir(self.cacheDir) == [])
+
+    def test_insecure_file(self):
+        
+        cache = SnapshotCache.SnapshotCache(self.cacheDir)
+        cache.put('lrmsver', '2.5.7')
+        os.chmod(os.path.join(self.cacheDir, 'lrmsver@default'), 0666)
+        self.assertTrue(cache.get('lrmsver') == None)
+
+    def test_fetch_handler(self):
+        
+        tmpfile = self.workspace.createFile(self.pbsnodesPattern)
+        cache = SnapshotCache.SnapshotCache(self.cacheDir)
+        cache.fetch('pbsnodes', None, PBSNodesHandler.parseCPUInfo, None, tmpfile)
+        os.remove(tmpfile)
+        
+        container = cache.fetch('pbsnodes', None, PBSNodesHandler.parseCPUInfo, None, tmpfile)
+        result = container.totalCPU == 4 and container.freeCPU == 3
+        self.assertTrue(result and container.gpuTable['cert-wn64-01.pn.pd.infn.it']['free_gpus'] == 1)
+
+
+
+class LastGoodTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = Workspace()
+        #
+        # the detached refresh may outlive the test, its files are kept
+        # away from the shared workspace
+        #
+        self.cacheDir = tempfile.mkdtemp('', 'lastgood')
+        self.qInfo = { 'cert' : QStatHandler.QueueInfoHandler() }
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheDir, True)
+
+    def test_save_load_ok(self):
+        
+        store = SnapshotCache.LastGoodStore(self.cacheDir, 600)
+        store.save('2013-08-21T11:37:25Z', '2.5.7', None, self.qInfo)
+        now, lrmsVer, cpuInfo, qInfo = store.load(['cert'])
+        self.assertTrue(now == '2013-08-21T11:37:25Z' and lrmsVer == '2.5.7' and 'cert' in qInfo)
+
+    def test_disabled(self):
+        
+        store = SnapshotCache.LastGoodStore(self.cacheDir, 0)
+        store.save('2013-08-21T11:37:25Z', '2.5.7', None, self.qInfo)
+        result = not store.enabled() and store.load(['cert']) == None
+        self.assertTrue(result and store.lockRefresh() == None)
+
+    def test_too_stale(self):
+        
+        SnapshotCache.LastGoodStore(self.cacheDir, 600).save('2013-08-21T11:37:25Z', '2.5.7', None, self.qInfo)
+        time.sleep(1.1)
+        self.assertTrue(SnapshotCache.LastGoodStore(self.cacheDir, 1).load(['cert']) == None)
+
+    def test_other_queues(self):
+        
+        store = SnapshotCache.LastGoodStore(self.cacheDir, 600)
+        store.save('2013-08-21T11:37:25Z', '2.5.7', None, self.qInfo)
+        self.assertTrue(store.load(['cert', 'long']) == None)
+
+    def test_refresh_lock(self):
+        
+        store = SnapshotCache.LastGoodStore(self.cacheDir, 600)
+        lockFile = store.lockRefresh()
+        result = lockFile <> None and store.lockRefresh() == None
+        lockFile.close()
+        
+        lockFile = store.lockRefresh()
+        result = result and lockFile <> None
+        lockFile.close()
+        self.assertTrue(result)
+
+    def _runProvider(self, configFile):
+        srcDir = os.path.dirname(os.path.dirname(os.path.abspath(SnapshotCache.__file__)))
+        env = dict(os.environ)
+        env['PATH'] = self.workspace.workspace + ':' + env['PATH']
+        env['PYTHONPATH'] = srcDir
+        
+        process = subprocess.Popen([sys.executable, os.path.join(srcDir, 'info-dynamic-pbs'), configFile],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        output, errors = process.communicate()
+        tStamps = [ line.split(':', 1)[1].strip() for line in output.splitlines()
+                    if line.startswith('GLUE2EntityCreationTime') ]
+        return process.returncode, tStamps
+
+    def test_published_on_failure(self):
+        
+        ldifDir = os.path.join(self.workspace.workspace, 'ldif')
+        os.mkdir(ldifDir)
+        ldifFile = open(os.path.join(ldifDir, 'static-file-Share.ldif'), 'w')
+        ldifFile.write('dn: GLUE2ShareID=cert_dteam,o=glue\nGLUE2ComputingShareMappingQueue: cert\n\n')
+        ldifFile.write('dn: GLUE2ManagerId=man,o=glue\nGLUE2ManagerID: man\n\n')
+        ldifFile.close()
+        bdiiConf = self.workspace.createFile('BDII_LDIF_DIR=%s\n' % ldifDir)
+        configFile = self.workspace.createFile('[Main]\nbdii-configfile = %s\noutputformat = glue2\n'
+                                               '[LRMS]\nsnapshot-dir = %s\nmax-staleness = 600\n'
+                                               '[Scheduler]\n' % (bdiiConf, self.cacheDir))
+        
+        self.workspace.createExecutable('pbsnodes', 
+                                        "#!/bin/sh\nprintf 'wn1\\n     state = free\\n     np = 4\\n\\n'\n")
+        self.workspace.createExecutable('qstat', '''#!/bin/sh
+case "$*" in
+*-B*) printf 'Server: ce\\n    pbs_version = 2.5.7\\n' ;;
+*-Q*) printf 'Queue: cert\\n    max_running = 10\\n    enabled = True\\n    started = True\\n' ;;
+esac
+''')
+        retCode1, tStamps1 = self._runProvider(configFile)
+        
+        #
+        # the snapshots of the single sources must not hide the failure
+        #
+        time.sleep(1.1)
+        for item in os.listdir(self.cacheDir):
+            if not item.startswith('last-good'):
+                os.remove(os.path.join(self.cacheDir, item))
+        
+        #
+        # the refresh is kept out, it could not run anyway
+        #
+        lockFile = SnapshotCache.LastGoodStore(self.cacheDir, 600).lockRefresh()
+        try:
+            self.workspace.createExecutable('qstat', '#!/bin/sh\necho "cannot connect to server" >&2\nexit 1\n')
+            retCode2, tStamps2 = self._runProvider(configFile)
+        finally:
+            lockFile.close()
+        
+        result = retCode1 == 0 and retCode2 == 0 and len(tStamps1) > 0
+        self.assertTrue(result and tStamps1 == tStamps2)
+
+
+if __name__ == '__main__':
+    unittest.main()
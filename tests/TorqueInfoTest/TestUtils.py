@@ -40,6 +40,14 @@ class Workspace:
         dataFile.close()
         return tmpfilename
         
+    def createExecutable(self, name, data):
+        filename = os.path.join(self.workspace, name)
+        dataFile = open(filename, 'w')
+        dataFile.write(data)
+        dataFile.close()
+        os.chmod(filename, 0755)
+        return filename
+        
     def appendToFile(self, data, filename):
         dataFile = open(filename, 'a')
         dataFile.write(data)
@@ -14,6 +14,6 @@
 # See the License for the specific language governing permissions and 
 # limitations under the License.
 
-__all__ = ["PBSNodesTestSuite", "QStatTestSuite", "MAUITestSuite", "TestUtils"]
+__all__ = ["PBSNodesTestSuite", "QStatTestSuite", "MAUITestSuite", "NvidiaSMITestSuite", "JobFormatTestSuite", "SnapshotCacheTestSuite", "CollectorDaemonTestSuite", "CommonUtilsTestSuite", "GlueRendererTestSuite", "JobTableTestSuite", "TestUtils"]
 
 